@@ -22,9 +22,18 @@
     'data': [
         'security/ir.model.access.csv',
         'data/sequence.xml',
+        'data/ir_cron.xml',
         'views/cost_sheet_views.xml',
         'views/stock_request_views.xml',
         'views/purchase_views.xml',
+        'views/project_views.xml',
+        'views/budget_reservation_views.xml',
+        'views/budget_refresh_run_views.xml',
+        'views/cost_sheet_snapshot_views.xml',
+        'views/cost_sheet_revision_views.xml',
+        'wizard/cost_sheet_link_wizard_views.xml',
+        'wizard/cost_sheet_import_views.xml',
+        'report/budget_report_views.xml',
         'views/menu.xml',
     ],
     'installable': True,
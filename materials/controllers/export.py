@@ -0,0 +1,181 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.http import http_date, parse_date
+from werkzeug.urls import url_encode
+
+from odoo import fields, http
+from odoo.http import request
+from odoo.tools import SQL, split_every
+
+# Default and maximum number of records per exported page
+EXPORT_PAGE_SIZE = 1000
+EXPORT_MAX_PAGE_SIZE = 10000
+# Number of records read per batch while serializing a page
+EXPORT_READ_BATCH_SIZE = 500
+
+# Exported datasets: model, domain and fields of each record
+EXPORT_DATASETS = {
+    'cost_sheets': {
+        'model': 'project.cost.sheet',
+        'domain': [],
+        'fields': [
+            'name', 'project_id', 'date', 'company_id', 'estimation_id', 'state',
+            'total_budgeted_cost', 'total_committed_amount', 'total_actual_amount', 'total_remaining_budget',
+            'closed_date',
+        ],
+    },
+    'cost_sheet_lines': {
+        'model': 'project.cost.sheet.line',
+        'domain': [],
+        'fields': [
+            'cost_sheet_id', 'project_id', 'sheet_state', 'product_id', 'cost_code', 'cost_type', 'uom_id',
+            'quantity', 'unit_cost', 'budgeted_cost', 'committed_quantity', 'committed_amount', 'actual_amount',
+            'reserved_quantity', 'reserved_amount', 'remaining_budget', 'budget_status',
+        ],
+    },
+    'purchase_lines': {
+        'model': 'purchase.order.line',
+        'domain': [('cost_sheet_line_id', '!=', False)],
+        'fields': [
+            'order_id', 'product_id', 'product_qty', 'product_uom', 'price_subtotal', 'currency_id',
+            'cost_sheet_line_id', 'reserved_quantity', 'reserved_amount', 'budget_status',
+        ],
+    },
+    'request_lines': {
+        'model': 'stock.request.line',
+        'domain': [('cost_sheet_line_id', '!=', False)],
+        'fields': [
+            'request_id', 'project_id', 'request_state', 'product_id', 'quantity', 'cost_sheet_line_id',
+            'budget_status',
+        ],
+    },
+}
+
+
+class BudgetExportController(http.Controller):
+    """Budget data export for BI tools, as JSON Lines.
+
+    Pages are walked with a keyset cursor on ``(write_date, id)`` instead of
+    an offset, so every page costs the same whatever its position, and
+    ``since`` restricts an export to the records changed since the last
+    sync. Each page carries an ``ETag`` and a ``Last-Modified`` header
+    derived from the keys of its records: a conditional request for an
+    unchanged page is answered with ``304`` before any record is read.
+    """
+
+    @http.route('/materials/export/<string:dataset>', type='http', auth='user', methods=['GET'], readonly=True)
+    def export_budget_data(self, dataset, since=None, cursor=None, limit=None, **kwargs):
+        """Export one page of ``dataset``.
+
+        :param since: ISO timestamp; only records written at or after it
+        :param cursor: ``X-Next-Cursor`` of the previous page
+        :param limit: number of records of the page
+        """
+        spec = EXPORT_DATASETS.get(dataset)
+        if not spec:
+            raise NotFound()
+        Model = request.env[spec['model']]
+        Model.check_access('read')
+        limit = self._parse_limit(limit)
+        keys = self._get_page_keys(Model, spec['domain'], self._parse_timestamp(since, 'since'),
+                                   self._parse_cursor(cursor), limit)
+
+        etag = '"%s"' % hashlib.sha1(json.dumps(
+            [dataset, spec['fields'], [(record_id, str(write_date)) for record_id, write_date in keys]],
+        ).encode()).hexdigest()
+        last_modified = max((write_date for __, write_date in keys), default=None)
+        headers = [('ETag', etag), ('Cache-Control', 'private, no-cache')]
+        if last_modified:
+            headers.append(('Last-Modified', http_date(last_modified)))
+        if len(keys) == limit:
+            next_cursor = '%s,%d' % (keys[-1][1].isoformat(), keys[-1][0])
+            next_url = '%s?%s' % (request.httprequest.path, url_encode({
+                **({'since': since} if since else {}), 'cursor': next_cursor, 'limit': limit,
+            }))
+            headers += [('X-Next-Cursor', next_cursor), ('Link', f'<{next_url}>; rel="next"')]
+
+        if self._is_not_modified(etag, last_modified):
+            return request.make_response(b'', headers=headers, status=304)
+        lines = [
+            json.dumps(values, separators=(',', ':')).encode() + b'\n'
+            for values in self._serialize(Model, spec['fields'], keys)
+        ]
+        return request.make_response(lines, headers=[('Content-Type', 'application/x-ndjson'), *headers])
+
+    def _parse_limit(self, limit):
+        try:
+            limit = int(limit) if limit else EXPORT_PAGE_SIZE
+        except ValueError:
+            raise BadRequest("limit must be an integer")
+        return max(1, min(limit, EXPORT_MAX_PAGE_SIZE))
+
+    def _parse_timestamp(self, value, name):
+        if not value:
+            return None
+        try:
+            timestamp = datetime.fromisoformat(value)
+        except ValueError:
+            raise BadRequest(f"{name} must be an ISO timestamp")
+        if timestamp.tzinfo:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        return timestamp
+
+    def _parse_cursor(self, cursor):
+        if not cursor:
+            return None
+        timestamp, __, record_id = cursor.rpartition(',')
+        if not record_id.isdigit():
+            raise BadRequest("invalid cursor")
+        return self._parse_timestamp(timestamp, 'cursor'), int(record_id)
+
+    def _get_page_keys(self, Model, domain, since, cursor, limit):
+        """Return the ``(id, write_date)`` of the records of the page.
+
+        ``write_date`` is read from the database with its full precision,
+        so that the cursor never skips records written in the same second.
+        """
+        Model.flush_model(['write_date'])
+        query = Model._search(domain, order='write_date, id', limit=limit)
+        write_date = SQL.identifier(query.table, 'write_date')
+        record_id = SQL.identifier(query.table, 'id')
+        if since:
+            query.add_where(SQL("%s >= %s", write_date, since))
+        if cursor:
+            query.add_where(SQL("(%s, %s) > (%s, %s)", write_date, record_id, *cursor))
+        request.env.cr.execute(query.select(record_id, write_date))
+        return request.env.cr.fetchall()
+
+    def _is_not_modified(self, etag, last_modified):
+        headers = request.httprequest.headers
+        if headers.get('If-None-Match'):
+            return etag in [tag.strip() for tag in headers['If-None-Match'].split(',')]
+        modified_since = parse_date(headers.get('If-Modified-Since'))
+        return bool(modified_since and last_modified
+                    and last_modified.replace(microsecond=0) <= modified_since.replace(tzinfo=None))
+
+    def _serialize(self, Model, fnames, keys):
+        """Yield the exported values of the records of the page, batch by batch."""
+        for batch in split_every(EXPORT_READ_BATCH_SIZE, keys):
+            write_dates = dict(batch)
+            records = Model.browse(write_dates)
+            records.fetch(fnames)
+            for record in records:
+                values = {'id': record.id, 'write_date': write_dates[record.id].isoformat()}
+                for fname in fnames:
+                    values[fname] = self._serialize_value(record._fields[fname], record[fname])
+                yield values
+            records.invalidate_recordset()
+
+    def _serialize_value(self, field, value):
+        if field.type == 'many2one':
+            return value.id or None
+        if field.type == 'date':
+            return value.isoformat() if value else None
+        if field.type == 'datetime':
+            return fields.Datetime.to_string(value) if value else None
+        if value is False and field.type != 'boolean':
+            return None
+        return value
@@ -1,3 +1,13 @@
 from . import cost_sheet
 from . import cost_request
-from . import purchase_order 
\ No newline at end of file
+from . import purchase_order 
+from . import account_analytic_account
+from . import account_analytic_line
+from . import cost_sheet_refresh
+from . import budget_reservation
+from . import budget_refresh_run
+from . import budget_rebuild
+from . import cost_sheet_snapshot
+from . import cost_sheet_revision
+from . import project_project
+from . import stock_picking
@@ -0,0 +1,9 @@
+from odoo import fields, models
+
+
+class AccountAnalyticAccount(models.Model):
+    _inherit = 'account.analytic.account'
+
+    cost_type = fields.Selection([
+        ('material', 'Material'),
+    ], string='Cost Type', help="Type of the costs booked on this account, matched against cost sheet lines")
@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+
+from odoo import api, fields, models
+
+# Analytic line fields feeding the actual amounts of cost sheet lines
+ACTUAL_SOURCE_FIELDS = {'amount', 'date', 'project_id', 'product_id', 'account_id'}
+
+
+class AccountAnalyticLine(models.Model):
+    _inherit = 'account.analytic.line'
+
+    # Same definition as hr_timesheet, so that both modules can be installed
+    project_id = fields.Many2one('project.project', 'Project', index='btree_not_null')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        if self.env.context.get('skip_budget_sync'):
+            return lines
+        if self.env['project.cost.sheet.line']._is_refresh_deferred():
+            self.env['project.cost.sheet.refresh.queue']._enqueue(
+                lines._get_actual_candidate_lines(), actual=True)
+        else:
+            cost_lines, totals = lines._get_actual_contributions()
+            cost_lines._apply_actual_contributions({}, totals)
+        return lines
+
+    def write(self, vals):
+        if not ACTUAL_SOURCE_FIELDS.intersection(vals):
+            return super().write(vals)
+        with self._sync_actual_amounts():
+            return super().write(vals)
+
+    def unlink(self):
+        with self._sync_actual_amounts():
+            return super().unlink()
+
+    def _get_actual_candidate_lines(self):
+        """Return the cost sheet lines the lines of ``self`` may feed."""
+        return self.env['project.cost.sheet.line']._get_candidate_lines(
+            self.project_id.ids, self.product_id.ids)
+
+    def _get_actual_contributions(self):
+        """Return what the lines of ``self`` add to cost sheet lines.
+
+        :return: tuple of the candidate cost sheet lines and the
+            ``_get_actual_totals`` result restricted to ``self``
+        """
+        cost_lines = self._get_actual_candidate_lines()
+        return cost_lines, cost_lines._get_actual_totals(analytic_line_ids=self.ids)
+
+    @contextmanager
+    def _sync_actual_amounts(self):
+        """Apply the actual amount deltas caused by the changes made in the block.
+
+        In deferred mode the affected cost sheet lines are queued for the
+        background refresh instead.
+        """
+        if self.env.context.get('skip_budget_sync') or not self:
+            yield
+            return
+        if self.env['project.cost.sheet.line']._is_refresh_deferred():
+            cost_lines = self._get_actual_candidate_lines()
+            yield
+            self.env['project.cost.sheet.refresh.queue']._enqueue(
+                cost_lines | self.exists()._get_actual_candidate_lines(), actual=True)
+            return
+        cost_lines_before, before = self._get_actual_contributions()
+        yield
+        cost_lines_after, after = self.exists()._get_actual_contributions()
+        (cost_lines_before | cost_lines_after)._apply_actual_contributions(before, after)
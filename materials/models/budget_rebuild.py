@@ -0,0 +1,176 @@
+import logging
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import odoo
+from odoo import api, fields, models
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger(__name__)
+
+# Number of cost sheet lines a worker rebuilds and commits at once; projects
+# are never split across chunks
+REBUILD_CHUNK_LINES = 5000
+# Number of rebuilt lines recomputed again by the final consistency check
+REBUILD_CHECK_SAMPLE = 1000
+
+# Read-write and read-only pools of the parent process, inherited through
+# fork by a rebuild worker
+_inherited_pools = None
+
+
+def _init_rebuild_worker(dbname):
+    """Give a forked rebuild worker its own database connections.
+
+    The connections inherited from the parent share their sockets with it:
+    they are kept referenced so that they are never closed from the worker,
+    and the worker opens its own read-write and read-only pools instead.
+    """
+    global _inherited_pools
+    _inherited_pools = (odoo.sql_db._Pool, getattr(odoo.sql_db, '_Pool_readonly', None))
+    odoo.sql_db._Pool = None
+    if hasattr(odoo.sql_db, '_Pool_readonly'):
+        odoo.sql_db._Pool_readonly = None
+    registry = Registry(dbname)
+    registry._db = odoo.sql_db.db_connect(dbname)
+    if getattr(registry, '_db_readonly', None) is not None:
+        registry._db_readonly = odoo.sql_db.db_connect(dbname, readonly=True)
+
+
+def _rebuild_project_chunk(dbname, uid, project_ids):
+    """Rebuild the budget figures of the projects of a chunk and commit.
+
+    :return: dict with the projects, the number of lines and the duration
+    """
+    start = time.perf_counter()
+    with Registry(dbname).cursor() as cr:
+        env = api.Environment(cr, uid, {})
+        lines = env['project.cost.sheet.line'].search([
+            ('project_id', 'in', project_ids),
+            ('sheet_state', '!=', 'done'),
+        ])
+        lines._refresh_actual_amounts()
+        lines._refresh_committed_amounts()
+        line_count = len(lines)
+    return {
+        'project_ids': project_ids,
+        'line_count': line_count,
+        'duration': time.perf_counter() - start,
+        'pid': os.getpid(),
+    }
+
+
+class CostSheetLine(models.Model):
+    _inherit = 'project.cost.sheet.line'
+
+    @api.model
+    def _get_rebuild_chunks(self, chunk_lines=REBUILD_CHUNK_LINES):
+        """Split the lines of open sheets into chunks of whole projects.
+
+        Projects are dealt largest first, so that the longest chunks start
+        first and the workers finish together.
+
+        :return: list of ``(project ids, line count)`` tuples
+        """
+        counts = self._read_group([('sheet_state', '!=', 'done')], ['project_id'], ['__count'])
+        chunks = []
+        project_ids, line_count = [], 0
+        for project, count in sorted(counts, key=lambda item: item[1], reverse=True):
+            if project_ids and line_count + count > chunk_lines:
+                chunks.append((project_ids, line_count))
+                project_ids, line_count = [], 0
+            project_ids.append(project.id)
+            line_count += count
+        if project_ids:
+            chunks.append((project_ids, line_count))
+        return chunks
+
+    @api.model
+    def _rebuild_budget_figures(self, workers=None, chunk_lines=REBUILD_CHUNK_LINES,
+                                check_sample=REBUILD_CHECK_SAMPLE):
+        """Rebuild committed and actual figures of every open cost sheet line.
+
+        Meant for after data migrations or analytic reorganizations, from
+        ``odoo-bin shell``::
+
+            env['project.cost.sheet.line']._rebuild_budget_figures(workers=8)
+
+        The lines are split by project into chunks that a pool of forked
+        processes rebuilds concurrently, each chunk in its own cursor and
+        transaction. Once every chunk is merged, a sample of the rebuilt
+        lines is recomputed again to check the figures, and the throughput
+        is logged and recorded as a refresh run.
+
+        :param workers: number of worker processes, defaults to the CPUs
+        :param chunk_lines: number of lines per chunk
+        :param check_sample: number of lines of the consistency check
+        :return: dict with the rebuild report
+        """
+        dbname = self.env.cr.dbname
+        workers = workers or os.cpu_count() or 1
+        chunks = self._get_rebuild_chunks(chunk_lines)
+        expected_lines = sum(line_count for __, line_count in chunks)
+        _logger.info("Rebuilding the budget figures of %d lines in %d chunks with %d workers",
+                     expected_lines, len(chunks), workers)
+        results, failed_project_ids = [], []
+        start_date = fields.Datetime.now()
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=_init_rebuild_worker, initargs=(dbname,)) as executor:
+            futures = {
+                executor.submit(_rebuild_project_chunk, dbname, self.env.uid, project_ids): project_ids
+                for project_ids, __ in chunks
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception:
+                    _logger.exception("Budget rebuild of projects %s failed", futures[future])
+                    failed_project_ids += futures[future]
+                    continue
+                results.append(result)
+                _logger.info("Rebuilt %d lines of %d projects in %.1fs (worker %d), %d/%d chunks done",
+                             result['line_count'], len(result['project_ids']), result['duration'],
+                             result['pid'], len(results), len(chunks))
+        duration = time.perf_counter() - start
+
+        rebuilt_lines = sum(result['line_count'] for result in results)
+        report = {
+            'chunks': len(chunks),
+            'workers': workers,
+            'lines': rebuilt_lines,
+            'expected_lines': expected_lines,
+            'failed_project_ids': failed_project_ids,
+            'duration': duration,
+            'lines_per_second': rebuilt_lines / duration if duration else 0.0,
+        }
+        # The workers committed after this transaction started: check and
+        # record in a new transaction that sees their work
+        with self.env.registry.cursor() as cr:
+            env = self.env(cr=cr)
+            rebuilt_project_ids = [project_id for result in results for project_id in result['project_ids']]
+            line_ids = env['project.cost.sheet.line'].search([
+                ('project_id', 'in', rebuilt_project_ids),
+                ('sheet_state', '!=', 'done'),
+            ]).ids
+            sample = env['project.cost.sheet.line'].browse(random.sample(line_ids, min(check_sample, len(line_ids))))
+            report['drifts'] = len(sample._reconcile_budget_figures())
+            env['project.budget.refresh.run'].sudo().create({
+                'operation': 'rebuild',
+                'date': start_date,
+                'duration': duration,
+                'record_count': rebuilt_lines,
+                'user_id': self.env.uid,
+                'summary': '\n'.join(f"{key}: {value}" for key, value in report.items()),
+            })
+        self.env.invalidate_all()
+
+        log = _logger.warning if report['drifts'] or failed_project_ids or rebuilt_lines != expected_lines \
+            else _logger.info
+        log("Budget rebuild: %d/%d lines in %.1fs (%.0f lines/s) with %d workers, %d failed projects, "
+            "%d drifting lines out of %d checked", rebuilt_lines, expected_lines, duration,
+            report['lines_per_second'], workers, len(failed_project_ids), report['drifts'], len(sample))
+        return report
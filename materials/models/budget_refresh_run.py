@@ -0,0 +1,140 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Number of lines timed one by one when a run is sampled in debug mode
+PROFILE_SAMPLE_LINES = 50
+# Number of slowest sampled lines reported for a run
+PROFILE_SLOWEST_LINES = 10
+# Key of the runs pending their creation in the precommit data of the cursor
+PENDING_RUNS_KEY = 'materials.refresh_runs'
+
+
+class BudgetRefreshRun(models.Model):
+    _name = 'project.budget.refresh.run'
+    _description = 'Budget Refresh Run'
+    _order = 'date desc, id desc'
+    _log_access = False
+
+    operation = fields.Selection([
+        ('update_actuals', 'Update Actuals'),
+        ('update_committed', 'Update Committed'),
+        ('refresh_actuals', 'Refresh Actuals'),
+        ('refresh_committed', 'Refresh Committed'),
+        ('line_costs', 'Cost Sheet Line Costs'),
+        ('line_remaining', 'Cost Sheet Line Remaining Budget'),
+        ('line_status', 'Cost Sheet Line Status'),
+        ('purchase_status', 'Purchase Line Budget Status'),
+        ('request_status', 'Request Line Budget Status'),
+        ('rebuild', 'Full Rebuild'),
+    ], string='Operation', required=True, readonly=True)
+    date = fields.Datetime('Started On', required=True, readonly=True, index=True)
+    duration = fields.Float('Duration (s)', readonly=True, digits=(16, 4))
+    query_count = fields.Integer('Queries', readonly=True)
+    query_time = fields.Float('Query Time (s)', readonly=True, digits=(16, 4))
+    record_count = fields.Integer('Records', readonly=True, help="Number of lines touched by the run")
+    user_id = fields.Many2one('res.users', 'User', readonly=True, ondelete='set null')
+    slowest_lines = fields.Text('Slowest Lines', readonly=True,
+                                help="Sampled per-line timings, filled in debug profiling mode")
+    summary = fields.Text('Summary', readonly=True, help="Throughput and consistency report of a full rebuild")
+
+    @api.model
+    def _get_profiling_mode(self):
+        """Return the profiling mode: ``off``, ``sampled``, ``on`` or ``debug``.
+
+        Runs are sampled by default, so that profiling the stored computes
+        only records a fraction of them.
+        """
+        return self.env['ir.config_parameter'].sudo().get_param('materials.refresh_profiling', 'sampled')
+
+    @api.model
+    @contextmanager
+    def _record(self, operation, records):
+        """Record duration, queries and size of the work done in the block.
+
+        Runs are buffered on the cursor and created together right before
+        the transaction commits, so that profiling stored computes does not
+        add one ``INSERT`` per computation.
+
+        :param operation: one of the ``operation`` selection values
+        :param records: the lines processed by the block
+        """
+        mode = self._get_profiling_mode()
+        if mode == 'off' or not records.ids or mode == 'sampled' and not self._is_sampled():
+            yield
+            return
+        thread = threading.current_thread()
+        start_count = self.env.cr.sql_log_count
+        start_query_time = getattr(thread, 'query_time', 0.0)
+        start_date = fields.Datetime.now()
+        start = time.perf_counter()
+        yield
+        values = {
+            'operation': operation,
+            'date': start_date,
+            'duration': time.perf_counter() - start,
+            'query_count': self.env.cr.sql_log_count - start_count,
+            'query_time': getattr(thread, 'query_time', 0.0) - start_query_time,
+            'record_count': len(records.ids),
+            'user_id': self.env.uid,
+        }
+        if mode == 'debug' and operation in ('refresh_actuals', 'refresh_committed') and self._is_sampled():
+            values['slowest_lines'] = self._profile_slowest_lines(operation, records)
+            _logger.debug("Slowest cost sheet lines of %s run:\n%s", operation, values['slowest_lines'])
+        precommit = self.env.cr.precommit
+        if PENDING_RUNS_KEY not in precommit.data:
+            precommit.add(self._create_pending_runs)
+        precommit.data.setdefault(PENDING_RUNS_KEY, []).append(values)
+
+    @api.model
+    def _create_pending_runs(self):
+        """Create the runs recorded in the transaction with one ``INSERT``."""
+        vals_list = self.env.cr.precommit.data.pop(PENDING_RUNS_KEY, [])
+        if vals_list:
+            self.sudo().create(vals_list)
+            self.flush_model()
+
+    @api.model
+    def _is_sampled(self):
+        rate = float(self.env['ir.config_parameter'].sudo().get_param('materials.refresh_profiling_sample_rate', 0.1))
+        return random.random() < rate
+
+    @api.model
+    def _profile_slowest_lines(self, operation, lines):
+        """Time the aggregation of a sample of lines one by one.
+
+        :return: text listing the slowest sampled lines with their timings
+        """
+        sample = lines.browse(random.sample(lines.ids, min(PROFILE_SAMPLE_LINES, len(lines.ids))))
+        timings = []
+        for line in sample:
+            start_count = self.env.cr.sql_log_count
+            start = time.perf_counter()
+            if operation == 'refresh_actuals':
+                line._get_actual_totals()
+            else:
+                line._get_committed_totals()
+            timings.append((time.perf_counter() - start, self.env.cr.sql_log_count - start_count, line))
+        timings.sort(key=lambda timing: timing[0], reverse=True)
+        return '\n'.join(
+            f"{duration * 1000:.1f} ms, {query_count} queries: line {line.id} "
+            f"({line.cost_sheet_id.name} / {line.product_id.display_name} / {line.cost_code or '-'})"
+            for duration, query_count, line in timings[:PROFILE_SLOWEST_LINES]
+        )
+
+    @api.model
+    def _cron_prune(self):
+        """Delete the runs older than the configured retention."""
+        days = int(self.env['ir.config_parameter'].sudo().get_param('materials.refresh_run_retention_days', 30))
+        self.env.cr.execute(
+            "DELETE FROM project_budget_refresh_run WHERE date < %s",
+            [fields.Datetime.now() - timedelta(days=days)],
+        )
+        self.invalidate_model()
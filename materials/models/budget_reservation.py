@@ -0,0 +1,123 @@
+from collections import defaultdict
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+
+class BudgetReservation(models.Model):
+    _name = 'project.budget.reservation'
+    _description = 'Budget Reservation Entry'
+    _order = 'id desc'
+
+    # Entries outlive the cost sheet lines they were posted on, and keep
+    # their sheet, product and currency once the line is deleted
+    cost_sheet_line_id = fields.Many2one('project.cost.sheet.line', 'Cost Sheet Line',
+                                         readonly=True, ondelete='set null', index=True)
+    cost_sheet_id = fields.Many2one('project.cost.sheet', 'Cost Sheet', readonly=True, ondelete='set null')
+    product_id = fields.Many2one('product.product', 'Product', readonly=True)
+    purchase_line_id = fields.Many2one('purchase.order.line', 'Purchase Order Line',
+                                       readonly=True, ondelete='set null', index=True)
+    order_id = fields.Many2one('purchase.order', 'Purchase Order', readonly=True, ondelete='set null', index=True)
+    move_type = fields.Selection([
+        ('reserve', 'Reserve'),
+        ('release', 'Release'),
+    ], string='Type', required=True, readonly=True)
+    quantity = fields.Float('Quantity', readonly=True,
+                            help="Signed quantity: positive when reserving, negative when releasing")
+    amount = fields.Monetary('Amount', readonly=True,
+                             help="Signed amount: positive when reserving, negative when releasing")
+    currency_id = fields.Many2one('res.currency', 'Currency', readonly=True)
+
+    def write(self, vals):
+        raise UserError(_("Budget reservation entries cannot be modified."))
+
+    def unlink(self):
+        raise UserError(_("Budget reservation entries cannot be deleted."))
+
+    @api.model
+    def _lock_cost_sheet_lines(self, cost_sheet_line_ids):
+        """Lock cost sheet lines in id order before checking or posting.
+
+        Under ``REPEATABLE READ`` a transaction locking a line another
+        transaction reserved on since its snapshot fails with a
+        serialization error and is retried, so every check sees the
+        reservations confirmed before it.
+        """
+        if not cost_sheet_line_ids:
+            return
+        self.env.cr.execute("""
+            SELECT id
+              FROM project_cost_sheet_line
+             WHERE id IN %s
+             ORDER BY id
+               FOR NO KEY UPDATE
+        """, [tuple(cost_sheet_line_ids)])
+
+    @api.model
+    def _post(self, entries):
+        """Append ledger entries and add them to the cached running totals.
+
+        Users cannot create entries directly; the ledger is only appended to
+        through this method.
+
+        :param entries: list of dicts with the values of the entries to create
+        """
+        entries = [entry for entry in entries if entry['quantity'] or entry['amount']]
+        if not entries:
+            return self.browse()
+        totals = defaultdict(lambda: [0.0, 0.0])
+        for entry in entries:
+            totals[entry['cost_sheet_line_id']][0] += entry['quantity']
+            totals[entry['cost_sheet_line_id']][1] += entry['amount']
+        self._lock_cost_sheet_lines(list(totals))
+        cost_lines = self.env['project.cost.sheet.line'].browse(totals)
+        for entry in entries:
+            line = cost_lines.browse(entry['cost_sheet_line_id'])
+            entry.update({
+                'cost_sheet_id': line.cost_sheet_id.id,
+                'product_id': line.product_id.id,
+                'currency_id': line.currency_id.id,
+            })
+        reservations = self.sudo().create(entries).sudo(self.env.su)
+        cost_lines.flush_recordset(['reserved_quantity', 'reserved_amount'])
+        self.env.cr.execute(f"""
+            UPDATE project_cost_sheet_line line
+               SET reserved_quantity = line.reserved_quantity + entry.quantity,
+                   reserved_amount = line.reserved_amount + entry.amount,
+                   write_uid = %s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM (VALUES {', '.join(['%s'] * len(totals))}) AS entry(id, quantity, amount)
+             WHERE line.id = entry.id
+        """, [self.env.uid, *((line_id, quantity, amount) for line_id, (quantity, amount) in totals.items())])
+        cost_lines.invalidate_recordset(['reserved_quantity', 'reserved_amount', 'write_uid', 'write_date'])
+        cost_lines.modified(['reserved_quantity', 'reserved_amount'])
+        cost_lines._recompute_linked_budget_status(['purchase.order.line'])
+        return reservations
+
+
+class CostSheetLine(models.Model):
+    _inherit = 'project.cost.sheet.line'
+
+    def unlink(self):
+        self._release_budget_reservations()
+        return super().unlink()
+
+    def _release_budget_reservations(self):
+        """Release what purchase lines still reserve on ``self`` before deletion.
+
+        The ledger of a deleted line then nets to zero, and the purchase
+        lines reserve again on the line they get linked to next.
+        """
+        purchase_lines = self.env['purchase.order.line'].search([('reserved_cost_sheet_line_id', 'in', self.ids)])
+        if purchase_lines:
+            purchase_lines._sync_budget_reservations(release_all=True)
+            purchase_lines._write_reserved_values([(line.id, None, 0.0, 0.0) for line in purchase_lines])
+
+
+class CostSheet(models.Model):
+    _inherit = 'project.cost.sheet'
+
+    def unlink(self):
+        # Lines are deleted by the database cascade, without their unlink
+        self.line_ids._release_budget_reservations()
+        return super().unlink()
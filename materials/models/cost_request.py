@@ -1,6 +1,14 @@
 #hi !
-from odoo import api, fields, models, _
+from collections import defaultdict
+
+from odoo import api, fields, models, Command, _
 from odoo.exceptions import UserError
+from odoo.tools import float_compare
+from odoo.tools.sql import create_index
+
+# Key of the request lines whose move quantities are pending an update in
+# the precommit data of the cursor
+PENDING_MOVE_UPDATE_KEY = 'materials.stock_request_line_ids'
 
 
 class StockRequestLine(models.Model):
@@ -13,32 +21,76 @@ class StockRequestLine(models.Model):
     quantity = fields.Float('Quantity', required=True)
     uom_id = fields.Many2one('uom.uom', 'Unit of Measure', related='product_id.uom_id')
     project_id = fields.Many2one('project.project', related='request_id.project_id', store=True)
-    cost_sheet_line_id = fields.Many2one('project.cost.sheet.line', 'Cost Sheet Line')
-    qty_in_progress = fields.Float('Qty In Progress', default=0.0)
-    qty_done = fields.Float('Qty Done', default=0.0)
+    cost_sheet_line_id = fields.Many2one('project.cost.sheet.line', 'Cost Sheet Line', index=True)
+    request_state = fields.Selection(related='request_id.state', store=True, string='Request Status')
+    move_ids = fields.One2many('stock.move', 'stock_request_line_id', 'Stock Moves')
+    qty_in_progress = fields.Float('Qty In Progress', default=0.0, readonly=True, copy=False,
+                                   help="Quantity of the open stock moves of the line")
+    qty_done = fields.Float('Qty Done', default=0.0, readonly=True, copy=False,
+                            help="Quantity of the done stock moves of the line")
     budget_status = fields.Selection([
         ('ok', 'OK'),
         ('overrun', 'Budget Overrun')
     ], string='Budget Status', compute='_compute_budget_status', store=True)
-    
-    @api.depends('quantity', 'cost_sheet_line_id.quantity')
+
+    def init(self):
+        super().init()
+        # Partial, like the purchase order line one
+        create_index(self.env.cr, 'stock_request_line_budget_write_date_id_index', self._table,
+                     ['write_date', 'id'], where='cost_sheet_line_id IS NOT NULL')
+
+    @api.depends('quantity', 'cost_sheet_line_id', 'request_state')
     def _compute_budget_status(self):
-        for line in self:
-            if line.cost_sheet_line_id and line.quantity > line.cost_sheet_line_id.quantity:
-                line.budget_status = 'overrun'
-            else:
-                line.budget_status = 'ok'
+        with self.env['project.budget.refresh.run']._record('request_status', self):
+            # Total requested per cost sheet line over every non-cancelled request
+            requested = dict(self._read_group(
+                [('cost_sheet_line_id', 'in', self.cost_sheet_line_id.ids), ('request_state', '!=', 'cancelled')],
+                ['cost_sheet_line_id'],
+                ['quantity:sum'],
+            ))
+            for line in self:
+                cost_line = line.cost_sheet_line_id
+                if not cost_line or line.request_state == 'cancelled':
+                    line.budget_status = 'ok'
+                    continue
+                total = requested.get(cost_line, 0.0)
+                if not line.id:
+                    # Unsaved changes replace what the database holds for this line
+                    origin = line._origin
+                    if origin and origin.cost_sheet_line_id == cost_line and origin.request_state != 'cancelled':
+                        total -= origin.quantity
+                    total += line.quantity
+                line.budget_status = 'overrun' if total > cost_line.quantity else 'ok'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines.cost_sheet_line_id._recompute_linked_budget_status(['stock.request.line'])
+        return lines
+
+    def write(self, vals):
+        if not {'quantity', 'cost_sheet_line_id', 'request_id'}.intersection(vals):
+            return super().write(vals)
+        cost_lines = self.cost_sheet_line_id
+        res = super().write(vals)
+        (cost_lines | self.cost_sheet_line_id)._recompute_linked_budget_status(['stock.request.line'])
+        return res
+
+    def _sync_cost_sheet_line_links(self, previous_lines):
+        """Recompute the sibling statuses after a mass link of ``self``."""
+        (previous_lines | self.cost_sheet_line_id)._recompute_linked_budget_status(['stock.request.line'])
+
+    def unlink(self):
+        cost_lines = self.cost_sheet_line_id
+        res = super().unlink()
+        cost_lines._recompute_linked_budget_status(['stock.request.line'])
+        return res
 
     @api.onchange('product_id', 'project_id')
     def _onchange_product_project(self):
         if self.product_id and self.project_id:
             # Find related cost sheet line
-            domain = [
-                ('cost_sheet_id.project_id', '=', self.project_id.id),
-                ('product_id', '=', self.product_id.id),
-                ('cost_sheet_id.state', '=', 'in_progress')
-            ]
-            cost_sheet_line = self.env['project.cost.sheet.line'].search(domain, limit=1)
+            cost_sheet_line = self.env['project.cost.sheet.line']._find_active_line(self.project_id, self.product_id)
             if cost_sheet_line:
                 self.cost_sheet_line_id = cost_sheet_line.id
                 # Set description from product name if empty
@@ -55,12 +107,7 @@ class StockRequestLine(models.Model):
 
     def find_cost_sheet_line(self):
         for line in self:
-            domain = [
-                ('cost_sheet_id.project_id', '=', line.project_id.id),
-                ('product_id', '=', line.product_id.id),
-                ('cost_sheet_id.state', '=', 'in_progress')
-            ]
-            cost_sheet_line = self.env['project.cost.sheet.line'].search(domain, limit=1)
+            cost_sheet_line = self.env['project.cost.sheet.line']._find_active_line(line.project_id, line.product_id)
             if cost_sheet_line:
                 line.cost_sheet_line_id = cost_sheet_line.id
                 # Create a detailed success message with specific cost sheet line information
@@ -99,6 +146,59 @@ class StockRequestLine(models.Model):
                     }
                 }
 
+    def action_link_cost_sheet_lines(self):
+        """Server action linking the selected lines to their cost sheet lines"""
+        summary = self.env['project.cost.sheet.line']._link_source_lines(self)
+        return self.env['project.cost.sheet.link.wizard']._notify_link_summary(summary)
+
+    def _mark_move_quantities_pending(self):
+        """Queue the update of the move quantities of ``self`` until precommit.
+
+        Moves change state one by one in many stock flows; collecting the
+        lines in the cursor's precommit data makes the whole transaction
+        cost a single aggregation.
+        """
+        if not self:
+            return
+        precommit = self.env.cr.precommit
+        if PENDING_MOVE_UPDATE_KEY not in precommit.data:
+            precommit.add(self._process_pending_move_quantities)
+        precommit.data.setdefault(PENDING_MOVE_UPDATE_KEY, set()).update(self.ids)
+
+    @api.model
+    def _process_pending_move_quantities(self):
+        """Update the move quantities of the lines queued so far."""
+        line_ids = self.env.cr.precommit.data.pop(PENDING_MOVE_UPDATE_KEY, set())
+        self.browse(line_ids).exists()._update_move_quantities()
+
+    def _update_move_quantities(self):
+        """Recompute ``qty_in_progress`` and ``qty_done`` from the stock moves.
+
+        Move quantities are summed per request line, state and unit in one
+        grouped query, then the requests' state follows the new totals.
+        """
+        if not self:
+            return
+        groups = self.env['stock.move']._read_group(
+            [('stock_request_line_id', 'in', self.ids), ('state', '!=', 'cancel')],
+            ['stock_request_line_id', 'state', 'product_uom'],
+            ['product_uom_qty:sum', 'quantity:sum'],
+        )
+        quantities = defaultdict(lambda: {'qty_in_progress': 0.0, 'qty_done': 0.0})
+        for line, state, uom, demand, quantity in groups:
+            if state == 'done':
+                quantities[line]['qty_done'] += uom._compute_quantity(quantity, line.uom_id, round=False)
+            else:
+                quantities[line]['qty_in_progress'] += uom._compute_quantity(demand, line.uom_id, round=False)
+        line_ids_by_values = defaultdict(list)
+        for line in self:
+            values = quantities[line]
+            if any(float_compare(line[fname], values[fname], precision_digits=6) for fname in values):
+                line_ids_by_values[values['qty_in_progress'], values['qty_done']].append(line.id)
+        for (qty_in_progress, qty_done), line_ids in line_ids_by_values.items():
+            self.browse(line_ids).write({'qty_in_progress': qty_in_progress, 'qty_done': qty_done})
+        self.request_id._update_state_from_moves()
+
 
 class StockRequest(models.Model):
     _name = 'stock.request'
@@ -126,6 +226,8 @@ class StockRequest(models.Model):
         ('cancelled', 'Cancelled')
     ], string='Status', default='draft', tracking=True)
     line_ids = fields.One2many('stock.request.line', 'request_id', 'Items')
+    picking_ids = fields.One2many('stock.picking', 'stock_request_id', 'Transfers')
+    picking_count = fields.Integer('Transfer Count', compute='_compute_picking_count')
     budget_warning = fields.Boolean('Budget Warning', compute='_compute_budget_warning', store=True)
     message_ids = fields.One2many(
         'mail.message', 'res_id',
@@ -142,8 +244,30 @@ class StockRequest(models.Model):
     
     @api.depends('line_ids.budget_status')
     def _compute_budget_warning(self):
+        overrun_requests = {
+            request for request, in self.env['stock.request.line']._read_group(
+                [('request_id', 'in', self.filtered('id').ids), ('budget_status', '=', 'overrun')],
+                ['request_id'],
+            )
+        }
+        for request in self:
+            if request.id:
+                request.budget_warning = request in overrun_requests
+            else:
+                request.budget_warning = any(line.budget_status == 'overrun' for line in request.line_ids)
+
+    def _compute_picking_count(self):
+        counts = dict(self.env['stock.picking']._read_group(
+            [('stock_request_id', 'in', self.ids)], ['stock_request_id'], ['__count']))
         for request in self:
-            request.budget_warning = any(line.budget_status == 'overrun' for line in request.line_ids)
+            request.picking_count = counts.get(request, 0)
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'state' in vals:
+            # Cancelling or reviving a request changes what its siblings consume
+            self.line_ids.cost_sheet_line_id._recompute_linked_budget_status(['stock.request.line'])
+        return res
 
     
     
@@ -151,7 +275,71 @@ class StockRequest(models.Model):
         self.write({'state': 'submitted'})
     
     def action_in_progress(self):
+        self.filtered(lambda request: not request.picking_ids)._create_pickings()
         self.write({'state': 'in_progress'})
+
+    def _create_pickings(self):
+        """Create and confirm one internal transfer per request.
+
+        Pickings of every request are created with their moves in a single
+        ``create`` and confirmed together.
+        """
+        vals_list = []
+        for request in self:
+            if not request.warehouse_id:
+                raise UserError(_("Set a warehouse on %s to create its transfers.", request.name))
+            picking_type = request.warehouse_id.int_type_id
+            location = picking_type.default_location_src_id
+            location_dest = request.location_id or picking_type.default_location_dest_id
+            vals_list.append({
+                'picking_type_id': picking_type.id,
+                'location_id': location.id,
+                'location_dest_id': location_dest.id,
+                'origin': request.name,
+                'scheduled_date': request.expected_date or fields.Datetime.now(),
+                'move_type': 'one' if request.shipping_policy == 'one' else 'direct',
+                'stock_request_id': request.id,
+                'move_ids': [
+                    Command.create({
+                        'name': line.name or line.product_id.display_name,
+                        'product_id': line.product_id.id,
+                        'product_uom_qty': line.quantity,
+                        'product_uom': line.uom_id.id,
+                        'location_id': location.id,
+                        'location_dest_id': location_dest.id,
+                        'stock_request_line_id': line.id,
+                        'route_ids': [Command.link(request.route_id.id)] if request.route_id else [],
+                    })
+                    for line in request.line_ids
+                ],
+            })
+        pickings = self.env['stock.picking'].create(vals_list)
+        pickings.action_confirm()
+        return pickings
+
+    def _update_state_from_moves(self):
+        """Move the requests along with the quantities of their moves.
+
+        Requests with every line fully done become done, requests with any
+        moved or moving quantity become in progress.
+        """
+        requests = self.filtered(lambda request: request.state in ('submitted', 'in_progress'))
+        done = requests.filtered(lambda request: request.line_ids and all(
+            float_compare(line.qty_done, line.quantity, precision_rounding=line.uom_id.rounding or 0.01) >= 0
+            for line in request.line_ids
+        ))
+        started = (requests - done).filtered(lambda request: request.state == 'submitted' and any(
+            line.qty_in_progress or line.qty_done for line in request.line_ids
+        ))
+        done.write({'state': 'done'})
+        started.write({'state': 'in_progress'})
+
+    def action_view_pickings(self):
+        self.ensure_one()
+        action = self.env['ir.actions.act_window']._for_xml_id('stock.action_picking_tree_all')
+        action['domain'] = [('stock_request_id', '=', self.id)]
+        action['context'] = {'create': False}
+        return action
     
     def action_done(self):
         self.write({'state': 'done'})
@@ -1,4 +1,84 @@
-from odoo import api, fields, models, _
+import logging
+from collections import defaultdict
+
+from odoo import api, fields, models, tools, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL, float_compare, split_every
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+# Number of cost sheet lines aggregated per grouped query in the refresh paths
+REFRESH_BATCH_SIZE = 1000
+
+# Number of purchase or stock request lines linked per flush by the mass linking
+LINK_CHUNK_SIZE = 2000
+
+# Number of parent orders or requests whose lines are recomputed per flush
+# when a budget revision propagates
+PROPAGATION_BATCH_SIZE = 200
+
+# Parent document of each line model linked to cost sheet lines
+LINKED_LINE_PARENTS = {
+    'purchase.order.line': 'order_id',
+    'stock.request.line': 'request_id',
+}
+
+# Budget defining fields of cost sheet lines, frozen once their sheet is closed
+FROZEN_LINE_FIELDS = {'cost_sheet_id', 'product_id', 'cost_code', 'cost_type', 'quantity', 'unit_cost'}
+
+# Fields maintained from purchase orders and analytic lines
+BUDGET_TRACKING_FIELDS = ('committed_quantity', 'committed_amount', 'actual_amount')
+
+
+class BudgetConversionCache:
+    """Currency rates and unit of measure factors shared by a refresh.
+
+    Rates are fetched in bulk per (company, date) and factors per pair of
+    units, so converting aggregated source rows into the currency and unit
+    of the cost sheet lines never costs a lookup per source line.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self._rates = {}
+        self._factors = {}
+
+    def prefetch_rates(self, keys):
+        """Fetch the rates of the ``(currency_id, company_id, date)`` keys."""
+        currency_ids_by_company_date = defaultdict(set)
+        for currency_id, company_id, date in keys:
+            if (currency_id, company_id, date) not in self._rates:
+                currency_ids_by_company_date[company_id, date].add(currency_id)
+        for (company_id, date), currency_ids in currency_ids_by_company_date.items():
+            currencies = self.env['res.currency'].browse(currency_ids)
+            rates = currencies._get_rates(self.env['res.company'].browse(company_id), date)
+            for currency_id in currency_ids:
+                self._rates[currency_id, company_id, date] = rates.get(currency_id) or 1.0
+
+    def prefetch_factors(self, pairs):
+        """Fetch the conversion factors of the ``(from_uom_id, to_uom_id)`` pairs."""
+        missing = {pair for pair in pairs if pair not in self._factors}
+        Uom = self.env['uom.uom']
+        Uom.browse({uom_id for pair in missing for uom_id in pair if uom_id}).fetch(['factor', 'category_id'])
+        for from_uom_id, to_uom_id in missing:
+            if not from_uom_id or not to_uom_id or from_uom_id == to_uom_id:
+                self._factors[from_uom_id, to_uom_id] = 1.0
+                continue
+            self._factors[from_uom_id, to_uom_id] = Uom.browse(from_uom_id)._compute_quantity(
+                1.0, Uom.browse(to_uom_id), round=False, raise_if_failure=False)
+
+    def convert_amount(self, amount, from_currency_id, to_currency_id, company_id, date):
+        """Convert ``amount``; the rates must have been prefetched."""
+        if not amount or not from_currency_id or from_currency_id == to_currency_id:
+            return amount
+        return amount * self._rates[to_currency_id, company_id, date] / self._rates[from_currency_id, company_id, date]
+
+    def convert_quantity(self, quantity, from_uom_id, to_uom_id):
+        """Convert ``quantity``; the factors must have been prefetched."""
+        if not quantity or from_uom_id == to_uom_id:
+            return quantity
+        return quantity * self._factors[from_uom_id, to_uom_id]
 
 
 class CostSheet(models.Model):
@@ -27,12 +107,26 @@ class CostSheet(models.Model):
     total_remaining_budget = fields.Monetary('Total Remaining Budget',
                                             compute='_compute_total_costs', store=True)
     line_ids = fields.One2many('project.cost.sheet.line', 'cost_sheet_id', 'Cost Lines')
+    refresh_queued_count = fields.Integer('Queued Lines', readonly=True, copy=False,
+                                          help="Number of lines queued when the current refresh was requested")
+    refresh_pending_count = fields.Integer('Pending Lines', compute='_compute_refresh_progress')
+    refresh_progress = fields.Float('Refresh Progress', compute='_compute_refresh_progress')
+    last_refresh_date = fields.Datetime('Last Refresh', readonly=True, copy=False)
+    closed_date = fields.Datetime('Closed On', readonly=True, copy=False)
+    closed_committed_amount = fields.Monetary('Final Committed Amount', readonly=True, copy=False)
+    closed_actual_amount = fields.Monetary('Final Actual Amount', readonly=True, copy=False)
+    closed_remaining_budget = fields.Monetary('Final Remaining Budget', readonly=True, copy=False)
     message_ids = fields.One2many(
         'mail.message', 'res_id',
         domain=lambda self: [('model', '=', self._name)],
         string='Messages',
         readonly=True)
 
+    def init(self):
+        super().init()
+        # Supports the keyset pagination of the budget export (controllers/export.py)
+        create_index(self.env.cr, 'project_cost_sheet_write_date_id_index', self._table, ['write_date', 'id'])
+
     @api.model_create_multi
     def create(self, vals_list):
         for vals in vals_list:
@@ -42,33 +136,149 @@ class CostSheet(models.Model):
 
     @api.depends('line_ids.budgeted_cost', 'line_ids.committed_amount', 'line_ids.actual_amount', 'line_ids.remaining_budget')
     def _compute_total_costs(self):
+        # Saved sheets are summed in the database without loading their lines
+        totals = {
+            sheet: aggregates
+            for sheet, *aggregates in self.env['project.cost.sheet.line']._read_group(
+                [('cost_sheet_id', 'in', self.filtered('id').ids)],
+                ['cost_sheet_id'],
+                ['budgeted_cost:sum', 'committed_amount:sum', 'actual_amount:sum', 'remaining_budget:sum'],
+            )
+        }
         for sheet in self:
-            sheet.total_budgeted_cost = sum(sheet.line_ids.mapped('budgeted_cost'))
-            sheet.total_committed_amount = sum(sheet.line_ids.mapped('committed_amount'))
-            sheet.total_actual_amount = sum(sheet.line_ids.mapped('actual_amount'))
-            sheet.total_remaining_budget = sum(sheet.line_ids.mapped('remaining_budget'))
+            if sheet.id:
+                budgeted, committed, actual, remaining = totals.get(sheet, (0.0, 0.0, 0.0, 0.0))
+            else:
+                budgeted = committed = actual = remaining = 0.0
+                for line in sheet.line_ids:
+                    budgeted += line.budgeted_cost
+                    committed += line.committed_amount
+                    actual += line.actual_amount
+                    remaining += line.remaining_budget
+            sheet.total_budgeted_cost = budgeted
+            sheet.total_committed_amount = committed
+            sheet.total_actual_amount = actual
+            sheet.total_remaining_budget = remaining
+
+    def _compute_refresh_progress(self):
+        pending = self._get_pending_refresh_counts()
+        for sheet in self:
+            sheet.refresh_pending_count = pending.get(sheet, 0)
+            if sheet.refresh_pending_count and sheet.refresh_queued_count:
+                done = max(sheet.refresh_queued_count - sheet.refresh_pending_count, 0)
+                sheet.refresh_progress = 100.0 * done / sheet.refresh_queued_count
+            else:
+                sheet.refresh_progress = 100.0
+
+    def _get_pending_refresh_counts(self):
+        return dict(self.env['project.cost.sheet.refresh.queue']._read_group(
+            [('cost_sheet_id', 'in', self.ids)], ['cost_sheet_id'], ['__count']))
+
+    def _start_refresh_progress(self):
+        """Stamp the number of queued lines of a refresh requested by a user."""
+        pending = self._get_pending_refresh_counts()
+        for sheet in self:
+            sheet.refresh_queued_count = pending.get(sheet, 0)
+
+    def _mark_refresh_progress(self):
+        """Stamp the progress of the sheets after a refreshed chunk.
+
+        Sheets whose queued lines have all been refreshed get their refresh
+        date. The queued count of the others grows to cover the lines queued
+        by source documents since the refresh started.
+        """
+        pending = self._get_pending_refresh_counts()
+        self.filtered(lambda sheet: not pending.get(sheet)).write({
+            'last_refresh_date': fields.Datetime.now(),
+            'refresh_queued_count': 0,
+        })
+        for sheet in self.filtered(lambda sheet: pending.get(sheet, 0) > sheet.refresh_queued_count):
+            sheet.refresh_queued_count = pending[sheet]
+
+    def write(self, vals):
+        lookup_changed = {'state', 'project_id'}.intersection(vals) and self._has_active_sheets()
+        res = super().write(vals)
+        if lookup_changed or {'state', 'project_id'}.intersection(vals) and self._has_active_sheets():
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        lookup_changed = self._has_active_sheets()
+        res = super().unlink()
+        if lookup_changed:
+            self.env.registry.clear_cache()
+        return res
+
+    def _has_active_sheets(self):
+        """Whether ``self`` holds sheets seen by the cached line lookups.
+
+        ``clear_cache`` empties the whole default cache of every worker, so
+        changes to draft and closed sheets must leave it alone.
+        """
+        return any(state == 'in_progress' for state in self.mapped('state'))
 
     def action_draft(self):
-        self.write({'state': 'draft'})
+        closed_sheets = self.filtered(lambda sheet: sheet.state == 'done')
+        self.write({'state': 'draft', **self._get_unfreeze_values()})
+        # Like a reopening, the figures of closed sheets catch up with the
+        # source documents changed while they were closed
+        self.env['project.cost.sheet.refresh.queue']._enqueue(closed_sheets.line_ids, actual=True, committed=True)
+        closed_sheets._start_refresh_progress()
 
     def action_in_progress(self):
         self.write({'state': 'in_progress'})
 
     def action_done(self):
-        self.write({'state': 'done'})
-    
-    def action_update_actuals(self):
-        """Update actual costs from analytic lines"""
+        """Close the sheets and freeze their final figures.
+
+        Lines of closed sheets are left out of the refresh engines, the
+        source document hooks and the cost sheet line lookups, so live
+        tracking only scales with the sheets in progress.
+        """
+        self.flush_recordset(['total_committed_amount', 'total_actual_amount', 'total_remaining_budget'])
         for sheet in self:
-            for line in sheet.line_ids:
-                line._update_actual_amount()
+            sheet.write({
+                'state': 'done',
+                'closed_date': fields.Datetime.now(),
+                'closed_committed_amount': sheet.total_committed_amount,
+                'closed_actual_amount': sheet.total_actual_amount,
+                'closed_remaining_budget': sheet.total_remaining_budget,
+            })
+        self.env['project.cost.sheet.refresh.queue'].search([('cost_sheet_id', 'in', self.ids)]).unlink()
+
+    def action_reopen(self):
+        """Restore live tracking of closed sheets.
+
+        The lines are queued for a full refresh, which catches up with the
+        source documents changed while the sheets were closed.
+        """
+        self.write({'state': 'in_progress', **self._get_unfreeze_values()})
+        self.env['project.cost.sheet.refresh.queue']._enqueue(self.line_ids, actual=True, committed=True)
+        self._start_refresh_progress()
+
+    @api.model
+    def _get_unfreeze_values(self):
+        return {
+            'closed_date': False,
+            'closed_committed_amount': 0.0,
+            'closed_actual_amount': 0.0,
+            'closed_remaining_budget': 0.0,
+        }
+
+    def action_update_actuals(self):
+        """Queue an update of actual costs from analytic lines"""
+        lines = self.filtered(lambda sheet: sheet.state != 'done').line_ids
+        with self.env['project.budget.refresh.run']._record('update_actuals', lines):
+            self.env['project.cost.sheet.refresh.queue']._enqueue(lines, actual=True)
+        lines.cost_sheet_id._start_refresh_progress()
         return True
-    
+
     def action_update_committed(self):
-        """Update committed costs from purchase orders"""
-        for sheet in self:
-            for line in sheet.line_ids:
-                line._update_committed_amount()
+        """Queue an update of committed costs from purchase orders"""
+        lines = self.filtered(lambda sheet: sheet.state != 'done').line_ids
+        with self.env['project.budget.refresh.run']._record('update_committed', lines):
+            self.env['project.cost.sheet.refresh.queue']._enqueue(lines, committed=True)
+        lines.cost_sheet_id._start_refresh_progress()
         return True
 
 
@@ -79,6 +289,8 @@ class CostSheetLine(models.Model):
     cost_sheet_id = fields.Many2one('project.cost.sheet', 'Cost Sheet',
                                     required=True, ondelete='cascade')
     product_id = fields.Many2one('product.product', 'Product', required=True)
+    project_id = fields.Many2one('project.project', related='cost_sheet_id.project_id', store=True, index=True)
+    sheet_state = fields.Selection(related='cost_sheet_id.state', store=True, string='Cost Sheet Status')
     cost_code = fields.Char('Cost Code')
     cost_type = fields.Selection([
         ('material', 'Material'),
@@ -98,6 +310,10 @@ class CostSheetLine(models.Model):
                                       help="Amount committed in purchase orders")
     actual_amount = fields.Monetary('Actual Amount', default=0.0,
                                    help="Actual cost recorded in analytic lines")
+    reserved_quantity = fields.Float('Reserved Qty', default=0.0, readonly=True, copy=False,
+                                     help="Running total of the budget reservation ledger")
+    reserved_amount = fields.Monetary('Reserved Amount', default=0.0, readonly=True, copy=False,
+                                      help="Running total of the budget reservation ledger")
     remaining_budget = fields.Monetary('Remaining Budget', compute='_compute_remaining_budget', store=True,
                                       help="Budgeted cost minus committed and actual amounts")
     budget_status = fields.Selection([
@@ -113,61 +329,551 @@ class CostSheetLine(models.Model):
         ('positive_quantity', 'CHECK(quantity > 0)', 'Quantity must be positive!')
     ]
 
+    def init(self):
+        super().init()
+        # Supports the (project, product) lookup of lines on in-progress sheets
+        create_index(self.env.cr, 'project_cost_sheet_line_active_project_product_index', self._table,
+                     ['project_id', 'product_id', 'id'], where="sheet_state = 'in_progress'")
+        # Also serves the ``since`` filter of the exported lines, which the
+        # raw updates of the tracking fields keep exact
+        create_index(self.env.cr, 'project_cost_sheet_line_write_date_id_index', self._table, ['write_date', 'id'])
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._check_sheet_not_closed()
+        if lines.cost_sheet_id._has_active_sheets():
+            self.env.registry.clear_cache()
+        return lines
+
+    def write(self, vals):
+        if FROZEN_LINE_FIELDS.intersection(vals):
+            self._check_sheet_not_closed()
+        lookup_fields = {'product_id', 'cost_sheet_id'}.intersection(vals)
+        lookup_changed = lookup_fields and self.cost_sheet_id._has_active_sheets()
+        res = super().write(vals)
+        if FROZEN_LINE_FIELDS.intersection(vals):
+            self._check_sheet_not_closed()
+        if lookup_changed or lookup_fields and self.cost_sheet_id._has_active_sheets():
+            self.env.registry.clear_cache()
+        if {'quantity', 'unit_cost'}.intersection(vals):
+            # Budget revisions only touch the statuses linked to the revised lines
+            self._recompute_linked_budget_status()
+        return res
+
+    def unlink(self):
+        self._check_sheet_not_closed()
+        lookup_changed = self.cost_sheet_id._has_active_sheets()
+        res = super().unlink()
+        if lookup_changed:
+            self.env.registry.clear_cache()
+        return res
+
+    def _check_sheet_not_closed(self):
+        closed_sheets = self.cost_sheet_id.filtered(lambda sheet: sheet.state == 'done')
+        if closed_sheets:
+            raise UserError(_("The budget of closed cost sheets cannot be changed: %s. Reopen them first.",
+                              ', '.join(closed_sheets.mapped('name'))))
+
+    @api.model
+    def _resolve_active_line_candidates(self, pairs):
+        """Return every line of an in-progress sheet matching each pair.
+
+        :param pairs: iterable of ``(project_id, product_id)`` tuples
+        :return: dict mapping the matched pairs to lists of line ids, oldest first
+        """
+        pairs = {(project_id, product_id) for project_id, product_id in pairs if project_id and product_id}
+        if not pairs:
+            return {}
+        self.flush_model(['project_id', 'product_id', 'sheet_state'])
+        self.env.cr.execute("""
+            SELECT project_id, product_id, ARRAY_AGG(id ORDER BY id)
+              FROM project_cost_sheet_line
+             WHERE sheet_state = 'in_progress'
+               AND (project_id, product_id) IN %s
+             GROUP BY project_id, product_id
+        """, [tuple(pairs)])
+        return {(project_id, product_id): line_ids for project_id, product_id, line_ids in self.env.cr.fetchall()}
+
+    @api.model
+    def _resolve_active_line_ids(self, pairs):
+        """Resolve (project, product) pairs to lines of in-progress cost sheets.
+
+        All pairs are resolved in one query; when several lines match a pair
+        the oldest one wins, as with ``search(domain, limit=1)``.
+
+        :param pairs: iterable of ``(project_id, product_id)`` tuples
+        :return: dict mapping the resolved pairs to cost sheet line ids
+        """
+        return {pair: line_ids[0] for pair, line_ids in self._resolve_active_line_candidates(pairs).items()}
+
+    @api.model
+    def _link_source_lines(self, records, chunk_size=LINK_CHUNK_SIZE):
+        """Link purchase order or stock request lines to their cost sheet line.
+
+        Candidates are resolved with one query per chunk and links are
+        written with one ``UPDATE`` per chunk. The environment is flushed
+        after each chunk so that the dependent budget statuses and warnings
+        are recomputed once per chunk. Lines matching several cost sheet
+        lines are left untouched. Linking requires write access on the
+        relinked records.
+
+        :param records: recordset with ``project_id``, ``product_id`` and
+            ``cost_sheet_line_id`` fields
+        :return: dict with the number of linked, ambiguous and unmatched lines
+        """
+        summary = {'linked': 0, 'ambiguous': 0, 'unmatched': 0}
+        for chunk in split_every(chunk_size, records.ids, records.browse):
+            candidates = self._resolve_active_line_candidates(
+                (record.project_id.id, record.product_id.id) for record in chunk
+            )
+            links = []
+            for record in chunk:
+                line_ids = candidates.get((record.project_id.id, record.product_id.id), [])
+                if len(line_ids) > 1:
+                    summary['ambiguous'] += 1
+                elif not line_ids:
+                    summary['unmatched'] += 1
+                else:
+                    summary['linked'] += 1
+                    if record.cost_sheet_line_id.id != line_ids[0]:
+                        links.append((record.id, line_ids[0]))
+            if links:
+                relinked = records.browse(record_id for record_id, __ in links)
+                # The raw UPDATE bypasses the access checks of ``write``
+                relinked.check_access('write')
+                previous_lines = relinked.cost_sheet_line_id
+                relinked.flush_recordset()
+                self.env.cr.execute(SQL(
+                    """
+                    UPDATE %s record
+                       SET cost_sheet_line_id = link.line_id,
+                           write_uid = %s,
+                           write_date = NOW() AT TIME ZONE 'UTC'
+                      FROM (VALUES %s) AS link(id, line_id)
+                     WHERE record.id = link.id
+                    """,
+                    SQL.identifier(records._table), self.env.uid,
+                    SQL(', ').join(SQL('(%s, %s)', record_id, line_id) for record_id, line_id in links),
+                ))
+                relinked.invalidate_recordset(['cost_sheet_line_id', 'write_uid', 'write_date'])
+                relinked.modified(['cost_sheet_line_id'])
+                relinked._sync_cost_sheet_line_links(previous_lines)
+            self.env.flush_all()
+            self.env.invalidate_all()
+        return summary
+
+    @api.model
+    @tools.ormcache('project_id', 'product_id')
+    def _get_active_line_id(self, project_id, product_id):
+        return self._resolve_active_line_ids([(project_id, product_id)]).get((project_id, product_id), False)
+
+    @api.model
+    def _find_active_line(self, project, product):
+        """Return the line budgeting ``product`` on an in-progress sheet of ``project``.
+
+        Results are cached per registry and invalidated whenever sheets
+        in progress change state or their lines are added, moved or removed.
+        """
+        if not project or not product:
+            return self.browse()
+        return self.browse(self._get_active_line_id(project.id, product.id))
+
     @api.depends('quantity', 'unit_cost')
     def _compute_costs(self):
-        for line in self:
-            line.budgeted_cost = line.quantity * line.unit_cost
+        with self.env['project.budget.refresh.run']._record('line_costs', self):
+            for line in self:
+                line.budgeted_cost = line.quantity * line.unit_cost
             
     @api.depends('budgeted_cost', 'committed_amount', 'actual_amount')
     def _compute_remaining_budget(self):
-        for line in self:
-            line.remaining_budget = line.budgeted_cost - line.committed_amount - line.actual_amount
+        with self.env['project.budget.refresh.run']._record('line_remaining', self):
+            for line in self:
+                line.remaining_budget = line.budgeted_cost - line.committed_amount - line.actual_amount
             
     @api.depends('budgeted_cost', 'committed_amount', 'actual_amount', 'quantity', 'committed_quantity')
     def _compute_budget_status(self):
-        for line in self:
-            # Start with 'ok' status
-            status = 'ok'
+        with self.env['project.budget.refresh.run']._record('line_status', self):
+            for line in self:
+                # Start with 'ok' status
+                status = 'ok'
             
-            # Check if committed quantity exceeds budgeted quantity
-            if line.committed_quantity > line.quantity:
-                status = 'overrun'
-            # Check if committed + actual amount exceeds budgeted cost
-            elif (line.committed_amount + line.actual_amount) > line.budgeted_cost:
-                status = 'overrun'
-            # Warning at 80% utilization
-            elif (line.committed_amount + line.actual_amount) >= (line.budgeted_cost * 0.8):
-                status = 'warning'
+                # Check if committed quantity exceeds budgeted quantity
+                if line.committed_quantity > line.quantity:
+                    status = 'overrun'
+                # Check if committed + actual amount exceeds budgeted cost
+                elif (line.committed_amount + line.actual_amount) > line.budgeted_cost:
+                    status = 'overrun'
+                # Warning at 80% utilization
+                elif (line.committed_amount + line.actual_amount) >= (line.budgeted_cost * 0.8):
+                    status = 'warning'
                 
-            line.budget_status = status
+                line.budget_status = status
             
     def _update_actual_amount(self):
         """Update actual amount from analytic lines"""
+        self._refresh_actual_amounts()
+
+    def _get_actual_totals(self, analytic_line_ids=None, conversions=None):
+        """Aggregate the analytic amounts matching each line in ``self``.
+
+        Analytic lines are summed per (project, product, account, currency,
+        day) in a single grouped query, and the accounts' cost type and code
+        are read in one batch, so the query count does not depend on the
+        number of lines. Amounts are converted into the currency of the cost
+        sheet's company with the rates of their day. A line without cost code
+        takes the amounts of every account code.
+
+        :param analytic_line_ids: optionally restrict the aggregation to these
+            analytic line ids
+        :param conversions: ``BudgetConversionCache`` shared by the batches
+            of a refresh
+        :return: dict mapping cost sheet line ids to their actual amount
+        """
+        totals = dict.fromkeys(self.ids, 0.0)
+        if not self or analytic_line_ids is not None and not analytic_line_ids:
+            return totals
+        conversions = conversions or BudgetConversionCache(self.env)
+        domain = [
+            ('project_id', 'in', self.project_id.ids),
+            ('product_id', 'in', self.product_id.ids),
+        ]
+        if analytic_line_ids is not None:
+            domain.append(('id', 'in', list(analytic_line_ids)))
+        groups = self.env['account.analytic.line']._read_group(
+            domain,
+            ['project_id', 'product_id', 'account_id', 'currency_id', 'date:day'],
+            ['amount:sum'],
+        )
+        # (project, product, cost type) -> {account code: [(currency, date, amount)]}
+        amounts = defaultdict(lambda: defaultdict(list))
+        for project, product, account, currency, date, amount in groups:
+            amounts[project.id, product.id, account.cost_type][account.code].append((currency.id, date, amount))
+        entries_by_line = {}
         for line in self:
-            domain = [
-                ('project_id', '=', line.cost_sheet_id.project_id.id),
-                ('product_id', '=', line.product_id.id),
-                ('account_id.cost_type', '=', line.cost_type),
-            ]
+            by_code = amounts.get((line.project_id.id, line.product_id.id, line.cost_type), {})
             if line.cost_code:
-                domain.append(('account_id.code', '=', line.cost_code))
-                
-            analytic_lines = self.env['account.analytic.line'].search(domain)
-            line.actual_amount = sum(analytic_lines.mapped('amount'))
+                entries_by_line[line] = by_code.get(line.cost_code, [])
+            else:
+                entries_by_line[line] = [entry for entries in by_code.values() for entry in entries]
+        rate_keys = set()
+        for line, entries in entries_by_line.items():
+            company_id = line.company_id.id or self.env.company.id
+            for currency_id, date, __ in entries:
+                if currency_id != line.currency_id.id:
+                    rate_keys.update([(currency_id, company_id, date), (line.currency_id.id, company_id, date)])
+        conversions.prefetch_rates(rate_keys)
+        for line, entries in entries_by_line.items():
+            company_id = line.company_id.id or self.env.company.id
+            totals[line.id] = sum(
+                conversions.convert_amount(amount, currency_id, line.currency_id.id, company_id, date)
+                for currency_id, date, amount in entries
+            )
+        return totals
+
+    def _refresh_actual_amounts(self):
+        """Recompute ``actual_amount`` for all lines in ``self`` in batches."""
+        Run = self.env['project.budget.refresh.run']
+        conversions = BudgetConversionCache(self.env)
+        for lines in split_every(REFRESH_BATCH_SIZE, self.ids, self.browse):
+            with Run._record('refresh_actuals', lines):
+                totals = lines._get_actual_totals(conversions=conversions)
+                lines._write_grouped({
+                    line.id: {'actual_amount': totals[line.id]}
+                    for line in lines
+                    if line._is_tracking_value_changed('actual_amount', totals[line.id])
+                })
+                lines.flush_recordset()
+
+    def _write_grouped(self, values_by_line):
+        """Write per-line values with one ``write`` per distinct set of values.
+
+        :param values_by_line: dict mapping line ids to the values to write
+        """
+        line_ids_by_values = defaultdict(list)
+        for line_id, vals in values_by_line.items():
+            line_ids_by_values[tuple(sorted(vals.items()))].append(line_id)
+        for vals, line_ids in line_ids_by_values.items():
+            self.browse(line_ids).write(dict(vals))
             
     def _update_committed_amount(self):
         """Update committed amount from purchase order lines"""
+        self._refresh_committed_amounts()
+
+    @api.model
+    def _resolve_analytic_distribution_keys(self, keys):
+        """Resolve analytic distribution keys to projects, codes and cost types.
+
+        A key is a comma-separated list of analytic account ids (one per
+        plan). Accounts are read and matched to projects in one query each.
+
+        :param keys: iterable of distribution keys
+        :return: dict mapping each key to a ``(project_ids, codes, cost_types)``
+            tuple of frozensets
+        """
+        account_ids_by_key = {
+            key: [int(account_id) for account_id in key.split(',') if account_id]
+            for key in keys
+        }
+        accounts = self.env['account.analytic.account'].browse(
+            {account_id for account_ids in account_ids_by_key.values() for account_id in account_ids}
+        ).exists()
+        project_ids_by_account = defaultdict(set)
+        for project in self.env['project.project'].search([('account_id', 'in', accounts.ids)]):
+            project_ids_by_account[project.account_id.id].add(project.id)
+        accounts_by_id = {account.id: account for account in accounts}
+        resolved = {}
+        for key, account_ids in account_ids_by_key.items():
+            key_accounts = [accounts_by_id[account_id] for account_id in account_ids if account_id in accounts_by_id]
+            resolved[key] = (
+                frozenset(project_id for account in key_accounts for project_id in project_ids_by_account[account.id]),
+                frozenset(account.code for account in key_accounts if account.code),
+                frozenset(account.cost_type for account in key_accounts if account.cost_type),
+            )
+        return resolved
+
+    def _get_committed_totals(self, po_line_ids=None, conversions=None):
+        """Aggregate the confirmed purchase quantities and amounts of ``self``.
+
+        Purchase order lines of confirmed orders are summed per product,
+        analytic distribution key, purchase unit, currency and order day in
+        one SQL query, each key weighted by its distribution percentage.
+        Keys are then resolved to projects, codes and cost types once, so the
+        query count stays constant whatever the number of cost sheet lines.
+        Quantities are converted into the unit of the cost sheet line and
+        amounts into the currency of the cost sheet's company.
+
+        :param po_line_ids: optionally restrict the aggregation to these
+            purchase order line ids
+        :param conversions: ``BudgetConversionCache`` shared by the batches
+            of a refresh
+        :return: dict mapping cost sheet line ids to ``(quantity, amount)``
+        """
+        totals = dict.fromkeys(self.ids, (0.0, 0.0))
+        project_accounts = self.project_id.account_id
+        if not self or not project_accounts or po_line_ids is not None and not po_line_ids:
+            return totals
+        conversions = conversions or BudgetConversionCache(self.env)
+        self.env['purchase.order.line'].flush_model(
+            ['order_id', 'product_id', 'product_qty', 'product_uom', 'price_subtotal', 'analytic_distribution'])
+        self.env['purchase.order'].flush_model(['state', 'currency_id', 'date_order', 'date_approve'])
+        query = """
+            SELECT pol.product_id,
+                   dist.key,
+                   pol.product_uom,
+                   po.currency_id,
+                   COALESCE(po.date_approve, po.date_order)::date,
+                   SUM(pol.product_qty * dist.value::float / 100.0),
+                   SUM(pol.price_subtotal * dist.value::float / 100.0)
+              FROM purchase_order_line pol
+              JOIN purchase_order po ON po.id = pol.order_id
+             CROSS JOIN LATERAL jsonb_each_text(pol.analytic_distribution) AS dist(key, value)
+             WHERE po.state IN ('purchase', 'done')
+               AND pol.product_id IN %(product_ids)s
+               AND EXISTS (
+                       SELECT 1
+                         FROM unnest(string_to_array(dist.key, ',')) AS account(id)
+                        WHERE account.id::int IN %(account_ids)s
+                   )
+        """
+        params = {
+            'product_ids': tuple(self.product_id.ids),
+            'account_ids': tuple(project_accounts.ids),
+        }
+        if po_line_ids is not None:
+            query += " AND pol.id IN %(po_line_ids)s"
+            params['po_line_ids'] = tuple(po_line_ids)
+        query += " GROUP BY pol.product_id, dist.key, pol.product_uom, po.currency_id, 5"
+        self.env.cr.execute(query, params)
+        rows = self.env.cr.fetchall()
+
+        resolved = self._resolve_analytic_distribution_keys({row[1] for row in rows})
+        # (project, product) -> [(codes, cost types, uom, currency, date, quantity, amount)]
+        entries = defaultdict(list)
+        for product_id, key, uom_id, currency_id, date, quantity, amount in rows:
+            project_ids, codes, cost_types = resolved[key]
+            for project_id in project_ids:
+                entries[project_id, product_id].append((codes, cost_types, uom_id, currency_id, date, quantity, amount))
+        entries_by_line = {}
+        rate_keys = set()
+        uom_pairs = set()
         for line in self:
-            domain = [
-                ('account_analytic_id.project_id', '=', line.cost_sheet_id.project_id.id),
-                ('product_id', '=', line.product_id.id),
-                ('order_id.state', 'in', ['purchase', 'done']),
-            ]
-            if line.cost_code:
-                domain.append(('analytic_distribution.cost_code', '=', line.cost_code))
-            if line.cost_type:
-                domain.append(('analytic_distribution.cost_type', '=', line.cost_type))
-                
-            po_lines = self.env['purchase.order.line'].search(domain)
-            line.committed_quantity = sum(po_lines.mapped('product_qty'))
-            line.committed_amount = sum(po_lines.mapped('price_subtotal'))
+            company_id = line.company_id.id or self.env.company.id
+            entries_by_line[line] = line_entries = []
+            for codes, cost_types, uom_id, currency_id, date, quantity, amount in entries.get(
+                    (line.project_id.id, line.product_id.id), ()):
+                if line.cost_code and line.cost_code not in codes:
+                    continue
+                if line.cost_type and line.cost_type not in cost_types:
+                    continue
+                line_entries.append((uom_id, currency_id, date, quantity, amount))
+                uom_pairs.add((uom_id, line.uom_id.id))
+                if currency_id != line.currency_id.id:
+                    rate_keys.update([(currency_id, company_id, date), (line.currency_id.id, company_id, date)])
+        conversions.prefetch_rates(rate_keys)
+        conversions.prefetch_factors(uom_pairs)
+        for line, line_entries in entries_by_line.items():
+            company_id = line.company_id.id or self.env.company.id
+            quantity = amount = 0.0
+            for uom_id, currency_id, date, entry_quantity, entry_amount in line_entries:
+                quantity += conversions.convert_quantity(entry_quantity, uom_id, line.uom_id.id)
+                amount += conversions.convert_amount(entry_amount, currency_id, line.currency_id.id, company_id, date)
+            totals[line.id] = (quantity, amount)
+        return totals
+
+    def _refresh_committed_amounts(self):
+        """Recompute committed quantities and amounts of ``self`` in batches."""
+        Run = self.env['project.budget.refresh.run']
+        conversions = BudgetConversionCache(self.env)
+        for lines in split_every(REFRESH_BATCH_SIZE, self.ids, self.browse):
+            with Run._record('refresh_committed', lines):
+                totals = lines._get_committed_totals(conversions=conversions)
+                values_by_line = {}
+                for line in lines:
+                    quantity, amount = totals[line.id]
+                    if line._is_tracking_value_changed('committed_quantity', quantity) \
+                            or line._is_tracking_value_changed('committed_amount', amount):
+                        values_by_line[line.id] = {'committed_quantity': quantity, 'committed_amount': amount}
+                lines._write_grouped(values_by_line)
+                lines.flush_recordset()
+
+    def _is_tracking_value_changed(self, fname, value):
+        """Return whether ``value`` differs from the stored tracking field."""
+        self.ensure_one()
+        if fname == 'committed_quantity':
+            return bool(float_compare(self[fname], value, precision_digits=6))
+        return bool(float_compare(self[fname], value, precision_rounding=self.currency_id.rounding or 0.01))
+
+    @api.model
+    def _is_refresh_deferred(self):
+        """Whether source document changes queue a refresh instead of applying deltas."""
+        mode = self.env['ir.config_parameter'].sudo().get_param('materials.budget_refresh_mode', 'incremental')
+        return mode == 'deferred'
+
+    @api.model
+    def _get_candidate_lines(self, project_ids, product_ids):
+        """Return the cost sheet lines a source document may contribute to."""
+        if not project_ids or not product_ids:
+            return self.browse()
+        return self.search([
+            ('project_id', 'in', list(project_ids)),
+            ('product_id', 'in', list(product_ids)),
+            ('sheet_state', '!=', 'done'),
+        ])
+
+    def _recompute_linked_budget_status(self, model_names=('purchase.order.line', 'stock.request.line')):
+        """Recompute the budget status of the lines linked to ``self``.
+
+        Linked purchase order and stock request lines are found through
+        their indexed ``cost_sheet_line_id`` and grouped by parent document,
+        so that each order or request warning is recomputed once. Large
+        sets are flushed batch by batch of whole parents.
+
+        :param model_names: linked line models to recompute
+        """
+        if not self:
+            return
+        for model_name in model_names:
+            Model = self.env[model_name]
+            parent_field = LINKED_LINE_PARENTS[model_name]
+            groups = Model._read_group([('cost_sheet_line_id', 'in', self.ids)], [parent_field], ['id:array_agg'])
+            batches = list(split_every(PROPAGATION_BATCH_SIZE, groups))
+            for batch in batches:
+                lines = Model.browse([line_id for __, line_ids in batch for line_id in line_ids])
+                parents = Model[parent_field].union(*(parent for parent, __ in batch))
+                # Marking the lines does not mark the fields depending on
+                # their status, so the parent warnings are marked as well
+                self.env.add_to_compute(Model._fields['budget_status'], lines)
+                self.env.add_to_compute(parents._fields['budget_warning'], parents)
+                if len(batches) > 1:
+                    lines.flush_recordset(['budget_status'])
+                    parents.flush_recordset(['budget_warning'])
+
+    def _apply_budget_deltas(self, deltas):
+        """Add signed deltas to the tracking fields of cost sheet lines.
+
+        The increments are applied in a single ``UPDATE`` so that concurrent
+        transactions never overwrite each other's contributions, and the
+        dependent stored fields are then marked for recomputation. The write
+        date is stamped like ``write`` does, for the clients of the export.
+
+        :param deltas: dict mapping line ids to ``{field name: delta}``
+        """
+        deltas = {line_id: vals for line_id, vals in deltas.items() if any(vals.values())}
+        if not deltas:
+            return
+        fnames = sorted({fname for vals in deltas.values() for fname in vals})
+        assert set(fnames) <= set(BUDGET_TRACKING_FIELDS), "Only tracking fields accept deltas"
+        lines = self.browse(deltas)
+        lines.flush_recordset(fnames)
+        rows = [(line_id, *(vals.get(fname, 0.0) for fname in fnames)) for line_id, vals in deltas.items()]
+        self.env.cr.execute(f"""
+            UPDATE project_cost_sheet_line line
+               SET {', '.join(f'{fname} = line.{fname} + delta.{fname}' for fname in fnames)},
+                   write_uid = %s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM (VALUES {', '.join(['%s'] * len(rows))}) AS delta(id, {', '.join(fnames)})
+             WHERE line.id = delta.id
+        """, [self.env.uid, *rows])
+        lines.invalidate_recordset(fnames + ['write_uid', 'write_date'])
+        lines.modified(fnames)
+
+    def _apply_committed_contributions(self, before, after):
+        """Apply the difference between two results of ``_get_committed_totals``."""
+        deltas = {}
+        for line_id in set(before) | set(after):
+            quantity_before, amount_before = before.get(line_id, (0.0, 0.0))
+            quantity_after, amount_after = after.get(line_id, (0.0, 0.0))
+            deltas[line_id] = {
+                'committed_quantity': quantity_after - quantity_before,
+                'committed_amount': amount_after - amount_before,
+            }
+        self._apply_budget_deltas(deltas)
+
+    def _apply_actual_contributions(self, before, after):
+        """Apply the difference between two results of ``_get_actual_totals``."""
+        self._apply_budget_deltas({
+            line_id: {'actual_amount': after.get(line_id, 0.0) - before.get(line_id, 0.0)}
+            for line_id in set(before) | set(after)
+        })
+
+    def _reconcile_budget_figures(self, fix=False):
+        """Compare the incrementally maintained figures with a full recompute.
+
+        :param fix: write the recomputed figures on the drifting lines
+        :return: list of dicts describing the drifting lines
+        """
+        drifts = []
+        conversions = BudgetConversionCache(self.env)
+        for lines in split_every(REFRESH_BATCH_SIZE, self.ids, self.browse):
+            actual_totals = lines._get_actual_totals(conversions=conversions)
+            committed_totals = lines._get_committed_totals(conversions=conversions)
+            batch_drifts = []
+            for line in lines:
+                expected = {
+                    'committed_quantity': committed_totals[line.id][0],
+                    'committed_amount': committed_totals[line.id][1],
+                    'actual_amount': actual_totals[line.id],
+                }
+                drift = {
+                    fname: (line[fname], value)
+                    for fname, value in expected.items()
+                    if line._is_tracking_value_changed(fname, value)
+                }
+                if drift:
+                    batch_drifts.append({'line_id': line.id, 'fields': drift})
+            if fix:
+                lines._write_grouped({
+                    drift['line_id']: {fname: values[1] for fname, values in drift['fields'].items()}
+                    for drift in batch_drifts
+                })
+            drifts += batch_drifts
+        if drifts:
+            _logger.warning("Budget figures drifted on %d cost sheet lines%s",
+                            len(drifts), " (fixed)" if fix else "")
+        return drifts
+
+    @api.model
+    def _cron_reconcile_budget_figures(self):
+        lines = self.search([('cost_sheet_id.state', '=', 'in_progress')])
+        lines._reconcile_budget_figures(fix=True)
@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Number of queued cost sheet lines refreshed and committed together
+REFRESH_CHUNK_SIZE = 500
+# Seconds a worker run may spend before handing over to a new cron trigger
+REFRESH_TIME_LIMIT = 240
+
+
+class CostSheetRefreshQueue(models.Model):
+    _name = 'project.cost.sheet.refresh.queue'
+    _description = 'Cost Sheet Refresh Queue'
+    _order = 'id'
+    _log_access = False
+
+    line_id = fields.Many2one('project.cost.sheet.line', 'Cost Sheet Line',
+                              required=True, ondelete='cascade', index=True)
+    cost_sheet_id = fields.Many2one('project.cost.sheet', 'Cost Sheet',
+                                    required=True, ondelete='cascade', index=True)
+    refresh_actual = fields.Boolean('Refresh Actuals')
+    refresh_committed = fields.Boolean('Refresh Committed')
+    enqueue_date = fields.Datetime('Enqueued On')
+
+    _sql_constraints = [
+        ('line_uniq', 'UNIQUE(line_id)', 'A cost sheet line can only be queued once!')
+    ]
+
+    @api.model
+    def _enqueue(self, lines, actual=False, committed=False):
+        """Mark cost sheet lines as dirty and wake up the refresh worker.
+
+        Lines already in the queue keep their pending flags, so enqueueing
+        is idempotent. Only the queue table is written: the cost sheets are
+        left alone, so that concurrent source document changes on one
+        project never wait on each other for its sheet rows.
+        """
+        if not lines or not (actual or committed):
+            return
+        lines.flush_recordset(['cost_sheet_id', 'sheet_state'])
+        # Lines of closed sheets keep their frozen figures
+        self.env.cr.execute("""
+            INSERT INTO project_cost_sheet_refresh_queue
+                        (line_id, cost_sheet_id, refresh_actual, refresh_committed, enqueue_date)
+                 SELECT id, cost_sheet_id, %s, %s, NOW() AT TIME ZONE 'UTC'
+                   FROM project_cost_sheet_line
+                  WHERE id IN %s
+                    AND sheet_state IS DISTINCT FROM 'done'
+            ON CONFLICT (line_id) DO UPDATE
+                    SET refresh_actual = project_cost_sheet_refresh_queue.refresh_actual OR EXCLUDED.refresh_actual,
+                        refresh_committed = project_cost_sheet_refresh_queue.refresh_committed OR EXCLUDED.refresh_committed
+        """, [actual, committed, tuple(lines.ids)])
+        self.invalidate_model()
+        self.env.ref('materials.ir_cron_process_budget_refresh_queue').sudo()._trigger()
+
+    @api.model
+    def _process_queue(self, chunk_size=REFRESH_CHUNK_SIZE, time_limit=REFRESH_TIME_LIMIT):
+        """Refresh queued lines chunk by chunk, committing after each chunk.
+
+        Entries are only removed in the transaction that refreshes them, so
+        an interrupted run simply resumes from the remaining entries. Rows
+        are claimed with ``SKIP LOCKED`` so that concurrent workers never
+        process the same lines.
+        """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        deadline = time.monotonic() + time_limit
+        while True:
+            self.env.cr.execute("""
+                SELECT id
+                  FROM project_cost_sheet_refresh_queue
+                 ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, [chunk_size])
+            entries = self.browse(id_ for id_, in self.env.cr.fetchall())
+            if not entries:
+                break
+            live_entries = entries.filtered(lambda entry: entry.line_id.sheet_state != 'done')
+            live_entries.filtered('refresh_actual').line_id._refresh_actual_amounts()
+            live_entries.filtered('refresh_committed').line_id._refresh_committed_amounts()
+            sheets = entries.cost_sheet_id
+            entries.unlink()
+            sheets._mark_refresh_progress()
+            if auto_commit:
+                self.env.cr.commit()
+            if time.monotonic() > deadline:
+                _logger.info("Cost sheet refresh queue not empty after %ss, rescheduling", time_limit)
+                self.env.ref('materials.ir_cron_process_budget_refresh_queue').sudo()._trigger()
+                break
+        return True
@@ -0,0 +1,339 @@
+from collections import defaultdict
+
+from odoo import api, fields, models, tools, _
+from odoo.exceptions import UserError
+from odoo.tools import float_compare
+from odoo.tools.sql import create_index
+
+from .cost_sheet import LINKED_LINE_PARENTS
+
+# Fields defining the budget of cost sheet lines, only changed by new
+# revisions once their sheet has been revised
+REVISED_LINE_FIELDS = {'cost_sheet_id', 'product_id', 'cost_code', 'quantity', 'unit_cost'}
+
+
+class CostSheetRevision(models.Model):
+    _name = 'project.cost.sheet.revision'
+    _description = 'Cost Sheet Revision'
+    _order = 'cost_sheet_id, number desc'
+
+    cost_sheet_id = fields.Many2one('project.cost.sheet', 'Cost Sheet', required=True, readonly=True,
+                                    ondelete='cascade', index=True)
+    number = fields.Integer('Revision', required=True, readonly=True)
+    date = fields.Datetime('Date', default=fields.Datetime.now, required=True, readonly=True)
+    user_id = fields.Many2one('res.users', 'Revised By', default=lambda self: self.env.user, readonly=True)
+    note = fields.Char('Reason', readonly=True)
+    estimation_id = fields.Char('Estimation Reference', readonly=True)
+    currency_id = fields.Many2one('res.currency', related='cost_sheet_id.currency_id')
+    line_ids = fields.One2many('project.cost.sheet.revision.line', 'revision_id', 'Changes', readonly=True)
+    added_count = fields.Integer('Added Lines', readonly=True)
+    updated_count = fields.Integer('Updated Lines', readonly=True)
+    removed_count = fields.Integer('Removed Lines', readonly=True)
+    budgeted_delta = fields.Monetary('Budget Change', readonly=True)
+
+    _sql_constraints = [
+        ('sheet_number_uniq', 'UNIQUE(cost_sheet_id, number)', 'A cost sheet revision number must be unique!')
+    ]
+
+    @api.depends('cost_sheet_id.name', 'number')
+    def _compute_display_name(self):
+        for revision in self:
+            revision.display_name = f"{revision.cost_sheet_id.name} R{revision.number}"
+
+
+class CostSheetRevisionLine(models.Model):
+    _name = 'project.cost.sheet.revision.line'
+    _description = 'Cost Sheet Revision Change'
+    _order = 'revision_id, id'
+    _log_access = False
+
+    revision_id = fields.Many2one('project.cost.sheet.revision', 'Revision', required=True, readonly=True,
+                                  ondelete='cascade', index=True)
+    # Denormalized from the revision for the grouped version resolution
+    cost_sheet_id = fields.Many2one('project.cost.sheet', 'Cost Sheet', required=True, readonly=True,
+                                    ondelete='cascade')
+    number = fields.Integer('Revision', required=True, readonly=True)
+    line_id = fields.Many2one('project.cost.sheet.line', 'Cost Sheet Line', readonly=True, ondelete='set null')
+    product_id = fields.Many2one('product.product', 'Product', required=True, readonly=True)
+    cost_code = fields.Char('Cost Code', readonly=True)
+    change = fields.Selection([
+        ('add', 'Added'),
+        ('update', 'Updated'),
+        ('remove', 'Removed'),
+    ], string='Change', required=True, readonly=True)
+    currency_id = fields.Many2one('res.currency', related='cost_sheet_id.currency_id')
+    old_quantity = fields.Float('Previous Qty', readonly=True)
+    new_quantity = fields.Float('New Qty', readonly=True)
+    old_unit_cost = fields.Monetary('Previous Unit Cost', readonly=True)
+    new_unit_cost = fields.Monetary('New Unit Cost', readonly=True)
+    budgeted_delta = fields.Monetary('Budget Change', readonly=True)
+
+    def init(self):
+        super().init()
+        # Supports the resolution of the budget of a sheet as of a revision
+        create_index(self.env.cr, 'project_cost_sheet_revision_line_sheet_key_number_index', self._table,
+                     ['cost_sheet_id', 'product_id', "COALESCE(cost_code, '')", 'number'])
+
+
+class CostSheetLine(models.Model):
+    _inherit = 'project.cost.sheet.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._check_sheet_not_revised()
+        return lines
+
+    def write(self, vals):
+        if REVISED_LINE_FIELDS.intersection(vals):
+            self._check_sheet_not_revised()
+        res = super().write(vals)
+        if 'cost_sheet_id' in vals:
+            self._check_sheet_not_revised()
+        return res
+
+    def unlink(self):
+        self._check_sheet_not_revised()
+        return super().unlink()
+
+    def _check_sheet_not_revised(self):
+        """Only let new revisions change the budget of revised sheets.
+
+        Past versions are rebuilt from the current lines and the changes
+        recorded by later revisions, so any other edit would rewrite them.
+        """
+        if self.env.context.get('cost_sheet_revision'):
+            return
+        revised_sheets = self.cost_sheet_id.filtered('revision_number')
+        if revised_sheets:
+            raise UserError(_("The budget of revised cost sheets can only be changed by a new revision: %s.",
+                              ', '.join(revised_sheets.mapped('name'))))
+
+
+class CostSheet(models.Model):
+    _inherit = 'project.cost.sheet'
+
+    revision_ids = fields.One2many('project.cost.sheet.revision', 'cost_sheet_id', 'Revisions')
+    revision_number = fields.Integer('Revision', default=0, readonly=True, copy=False,
+                                     help="Number of the current version of the budget")
+
+    def _revise(self, lines_vals, note=False, estimation_id=False, remove_missing=True):
+        """Apply a new version of the budget and record it as a revision.
+
+        The new version is compared to the current lines by product and cost
+        code: only the lines that change are written, created or removed,
+        and only those changes are stored in the revision. Lines and values
+        sharing a product and cost code are compared by their total quantity
+        and average unit cost, as read by ``_read_current_budget``, and
+        changed lines are merged into one.
+
+        :param lines_vals: list of dicts with ``product_id``, ``cost_code``,
+            ``quantity`` and ``unit_cost``, and optionally ``cost_type``
+        :param remove_missing: remove the current lines absent from
+            ``lines_vals``, as for a full estimation
+        :return: the new revision
+        """
+        self.ensure_one()
+        if self.state == 'done':
+            raise UserError(_("Reopen the cost sheet %s before revising its budget.", self.name))
+        CostSheetLine = self.env['project.cost.sheet.line'].with_context(cost_sheet_revision=True)
+        current = self._read_current_budget()
+        lines_by_key = defaultdict(lambda: CostSheetLine)
+        for line in self.line_ids.with_context(cost_sheet_revision=True):
+            lines_by_key[line.product_id.id, line.cost_code or False] |= line
+        rounding = self.currency_id.rounding or 0.01
+
+        new_budget = {}
+        for vals in lines_vals:
+            key = (vals['product_id'], vals.get('cost_code') or False)
+            if key not in new_budget:
+                new_budget[key] = dict(vals)
+                continue
+            merged = new_budget[key]
+            quantity = merged['quantity'] + vals['quantity']
+            if quantity:
+                merged['unit_cost'] = (merged['quantity'] * merged['unit_cost']
+                                       + vals['quantity'] * vals['unit_cost']) / quantity
+            merged['quantity'] = quantity
+
+        changes, values_by_line, added_vals, merged_line_ids = [], {}, [], {}
+        removed_lines = CostSheetLine
+        for key, vals in new_budget.items():
+            lines = lines_by_key.get(key)
+            if not lines:
+                added_vals.append({
+                    'cost_sheet_id': self.id,
+                    'product_id': key[0],
+                    'cost_code': key[1],
+                    'cost_type': vals.get('cost_type') or 'material',
+                    'quantity': vals['quantity'],
+                    'unit_cost': vals['unit_cost'],
+                })
+                changes.append(('add', lines, key, 0.0, vals['quantity'], 0.0, vals['unit_cost']))
+                continue
+            old_quantity, old_unit_cost = current[key]
+            if float_compare(old_quantity, vals['quantity'], precision_digits=6) \
+                    or float_compare(old_unit_cost, vals['unit_cost'], precision_rounding=rounding):
+                values_by_line[lines[0].id] = {'quantity': vals['quantity'], 'unit_cost': vals['unit_cost']}
+                if len(lines) > 1:
+                    removed_lines |= lines[1:]
+                    merged_line_ids[lines[0].id] = lines[1:].ids
+                changes.append(('update', lines[0], key, old_quantity, vals['quantity'],
+                                old_unit_cost, vals['unit_cost']))
+        if remove_missing:
+            for key, lines in lines_by_key.items():
+                if key not in new_budget:
+                    removed_lines |= lines
+                    old_quantity, old_unit_cost = current[key]
+                    changes.append(('remove', lines[0], key, old_quantity, 0.0, old_unit_cost, 0.0))
+        if not changes:
+            raise UserError(_("The new budget of %s does not change any line.", self.name))
+
+        number = self.revision_number + 1
+        # Versions resolved in this transaction must not outlive a rollback
+        self.env.cr.postrollback.add(self.env.registry.clear_cache)
+        # Revisions are only recorded here, users cannot create them
+        revision = self.env['project.cost.sheet.revision'].sudo().create({
+            'cost_sheet_id': self.id,
+            'number': number,
+            'note': note,
+            'estimation_id': estimation_id,
+            'added_count': len(added_vals),
+            'updated_count': len(values_by_line),
+            'removed_count': sum(change == 'remove' for change, *__ in changes),
+            'budgeted_delta': sum(
+                new_quantity * new_unit_cost - old_quantity * old_unit_cost
+                for __, __, __, old_quantity, new_quantity, old_unit_cost, new_unit_cost in changes
+            ),
+        })
+        CostSheetLine._write_grouped(values_by_line)
+        added_lines = CostSheetLine.create(added_vals)
+        added_lines_by_key = {(line.product_id.id, line.cost_code or False): line for line in added_lines}
+        self.env['project.cost.sheet.revision.line'].sudo().create([
+            {
+                'revision_id': revision.id,
+                'cost_sheet_id': self.id,
+                'number': number,
+                'line_id': (line or added_lines_by_key[key]).id if change != 'remove' else False,
+                'product_id': key[0],
+                'cost_code': key[1],
+                'change': change,
+                'old_quantity': old_quantity,
+                'new_quantity': new_quantity,
+                'old_unit_cost': old_unit_cost,
+                'new_unit_cost': new_unit_cost,
+                'budgeted_delta': new_quantity * new_unit_cost - old_quantity * old_unit_cost,
+            }
+            for change, line, key, old_quantity, new_quantity, old_unit_cost, new_unit_cost in changes
+        ])
+        # Documents linked to merged lines follow the line they are merged into
+        for line_id, duplicate_ids in merged_line_ids.items():
+            for model_name in LINKED_LINE_PARENTS:
+                self.env[model_name].search([('cost_sheet_line_id', 'in', duplicate_ids)]).write(
+                    {'cost_sheet_line_id': line_id})
+        removed_lines.unlink()
+        self.revision_number = number
+        # New lines pick up the purchases and analytic lines already recorded
+        self.env['project.cost.sheet.refresh.queue']._enqueue(added_lines, actual=True, committed=True)
+        return revision.sudo(self.env.su)
+
+    def _get_effective_budget(self, number=None):
+        """Return the budget of the sheet as of revision ``number``.
+
+        Results of revised sheets are cached: their lines only change
+        through new revisions, which never alter the earlier versions.
+
+        :param number: revision number, the current version by default
+        :return: dict mapping ``(product_id, cost_code)`` to
+            ``(quantity, unit_cost)``
+        """
+        self.ensure_one()
+        if not self.revision_number:
+            return self._read_current_budget()
+        if number is None or number >= self.revision_number:
+            number = self.revision_number
+        return dict(self._resolve_effective_budget(number))
+
+    def _read_current_budget(self):
+        """Return the current budget per product and cost code.
+
+        Lines sharing a product and cost code count with their total
+        quantity and their unit cost averaged over it.
+        """
+        self.env['project.cost.sheet.line'].flush_model(['cost_sheet_id', 'product_id', 'cost_code', 'quantity',
+                                                         'unit_cost'])
+        self.env.cr.execute("""
+            SELECT product_id, cost_code, SUM(quantity),
+                   CASE WHEN COUNT(*) = 1 OR SUM(quantity) = 0 THEN MAX(unit_cost)
+                        ELSE SUM(quantity * unit_cost) / SUM(quantity) END
+              FROM project_cost_sheet_line
+             WHERE cost_sheet_id = %s
+          GROUP BY product_id, cost_code
+        """, [self.id])
+        return {(product_id, cost_code or False): (quantity, unit_cost)
+                for product_id, cost_code, quantity, unit_cost in self.env.cr.fetchall()}
+
+    @tools.ormcache('self.id', 'number')
+    def _resolve_effective_budget(self, number):
+        """Resolve the budget as of a revision through the revision chain.
+
+        The current version is read from the sheet lines. Every line changed
+        after ``number`` takes the previous values of the first later
+        revision that changed it, resolved in one grouped query, so the cost
+        does not depend on the number of revisions in between.
+
+        :return: tuple of ``((product_id, cost_code), (quantity, unit_cost))``
+        """
+        budget = self._read_current_budget()
+        if number < self.revision_number:
+            self.env['project.cost.sheet.revision.line'].flush_model()
+            self.env.cr.execute("""
+                SELECT DISTINCT ON (product_id, COALESCE(cost_code, ''))
+                       product_id, cost_code, change, old_quantity, old_unit_cost
+                  FROM project_cost_sheet_revision_line
+                 WHERE cost_sheet_id = %s AND number > %s
+              ORDER BY product_id, COALESCE(cost_code, ''), number, id
+            """, [self.id, number])
+            for product_id, cost_code, change, old_quantity, old_unit_cost in self.env.cr.fetchall():
+                key = (product_id, cost_code or False)
+                if change == 'add':
+                    # The line did not exist yet
+                    budget.pop(key, None)
+                else:
+                    budget[key] = (old_quantity, old_unit_cost)
+        return tuple(budget.items())
+
+    def _get_budget_diff(self, number_from, number_to=None):
+        """Compare the budget of two revisions.
+
+        :return: list of dicts with the product, cost code, change and the
+            quantities and unit costs of both versions
+        """
+        budget_from = self._get_effective_budget(number_from)
+        budget_to = self._get_effective_budget(number_to)
+        diff = []
+        for key in sorted(budget_from.keys() | budget_to.keys(), key=lambda key: (key[0], key[1] or '')):
+            old, new = budget_from.get(key), budget_to.get(key)
+            if old == new:
+                continue
+            diff.append({
+                'product_id': key[0],
+                'cost_code': key[1],
+                'change': 'add' if old is None else 'remove' if new is None else 'update',
+                'old_quantity': old[0] if old else 0.0,
+                'new_quantity': new[0] if new else 0.0,
+                'old_unit_cost': old[1] if old else 0.0,
+                'new_unit_cost': new[1] if new else 0.0,
+            })
+        return diff
+
+    def action_view_revisions(self):
+        self.ensure_one()
+        return {
+            'name': _('Revisions'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'project.cost.sheet.revision',
+            'view_mode': 'list,form',
+            'domain': [('cost_sheet_id', '=', self.id)],
+            'context': {'create': False},
+        }
@@ -0,0 +1,147 @@
+from odoo import api, fields, models
+from odoo.tools.sql import create_index
+
+# Tracked figures of cost sheet lines, with the snapshot column holding their change
+SNAPSHOT_FIELDS = {
+    'budgeted_cost': 'budgeted_delta',
+    'committed_quantity': 'committed_quantity_delta',
+    'committed_amount': 'committed_delta',
+    'actual_amount': 'actual_delta',
+}
+
+
+class CostSheetSnapshot(models.Model):
+    _name = 'project.cost.sheet.snapshot'
+    _description = 'Cost Sheet Line Snapshot'
+    _order = 'period desc, line_id'
+    _rec_name = 'line_id'
+    _log_access = False
+
+    line_id = fields.Many2one('project.cost.sheet.line', 'Cost Sheet Line',
+                              required=True, readonly=True, ondelete='cascade')
+    cost_sheet_id = fields.Many2one('project.cost.sheet', 'Cost Sheet', readonly=True, ondelete='cascade')
+    project_id = fields.Many2one('project.project', 'Project', readonly=True)
+    product_id = fields.Many2one('product.product', 'Product', readonly=True)
+    cost_code = fields.Char('Cost Code', readonly=True)
+    period = fields.Date('Period', required=True, readonly=True)
+    currency_id = fields.Many2one('res.currency', related='cost_sheet_id.currency_id')
+    budgeted_cost = fields.Monetary('Budgeted Cost', readonly=True)
+    committed_quantity = fields.Float('Committed Qty', readonly=True)
+    committed_amount = fields.Monetary('Committed Amount', readonly=True)
+    actual_amount = fields.Monetary('Actual Amount', readonly=True)
+    consumption = fields.Float('Consumption (%)', readonly=True, aggregator='max',
+                               help="Committed and actual amounts over the budgeted cost")
+    # Changes since the previous snapshot of the line, cumulated by the graph views
+    budgeted_delta = fields.Monetary('Budgeted Cost Change', readonly=True)
+    committed_quantity_delta = fields.Float('Committed Qty Change', readonly=True)
+    committed_delta = fields.Monetary('Committed Change', readonly=True)
+    actual_delta = fields.Monetary('Actual Change', readonly=True)
+
+    _sql_constraints = [
+        ('line_period_uniq', 'UNIQUE(line_id, period)', 'A cost sheet line has one snapshot per period!')
+    ]
+
+    def init(self):
+        super().init()
+        create_index(self.env.cr, 'project_cost_sheet_snapshot_project_period_index', self._table,
+                     ['project_id', 'period'])
+
+    @api.model
+    def _take_snapshots(self, period=None):
+        """Store the figures of every in-progress line that changed since its last snapshot.
+
+        Unchanged lines are skipped, so the table grows with the number of
+        changes rather than with the number of lines times periods.
+
+        :param period: date of the snapshot, today by default
+        :return: number of snapshots written
+        """
+        period = period or fields.Date.context_today(self)
+        self.env['project.cost.sheet.line'].flush_model()
+        changed = ' OR '.join(f'last.{fname} IS DISTINCT FROM line.{fname}' for fname in SNAPSHOT_FIELDS)
+        columns = ', '.join(list(SNAPSHOT_FIELDS) + list(SNAPSHOT_FIELDS.values()))
+        values = ', '.join(
+            [f'line.{fname}' for fname in SNAPSHOT_FIELDS]
+            + [f'line.{fname} - COALESCE(last.{fname}, 0)' for fname in SNAPSHOT_FIELDS]
+        )
+        updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in columns.split(', '))
+        self.env.cr.execute(f"""
+            INSERT INTO project_cost_sheet_snapshot
+                        (line_id, cost_sheet_id, project_id, product_id, cost_code, period, consumption, {columns})
+                 SELECT line.id, line.cost_sheet_id, line.project_id, line.product_id, line.cost_code, %(period)s,
+                        CASE WHEN line.budgeted_cost > 0
+                             THEN 100.0 * (line.committed_amount + line.actual_amount) / line.budgeted_cost
+                             ELSE 0.0 END,
+                        {values}
+                   FROM project_cost_sheet_line line
+              LEFT JOIN LATERAL (
+                            SELECT *
+                              FROM project_cost_sheet_snapshot snapshot
+                             WHERE snapshot.line_id = line.id
+                               AND snapshot.period < %(period)s
+                             ORDER BY snapshot.period DESC
+                             LIMIT 1
+                        ) last ON TRUE
+                  WHERE line.sheet_state = 'in_progress'
+                    AND (last.id IS NULL OR {changed} OR EXISTS (
+                            SELECT 1
+                              FROM project_cost_sheet_snapshot current
+                             WHERE current.line_id = line.id
+                               AND current.period = %(period)s
+                        ))
+            ON CONFLICT (line_id, period) DO UPDATE
+                    SET consumption = EXCLUDED.consumption, {updates}
+        """, {'period': period})
+        self.invalidate_model()
+        return self.env.cr.rowcount
+
+    @api.model
+    def _cron_take_snapshots(self):
+        self._take_snapshots()
+
+    @api.model
+    def _get_series(self, project_ids, date_from=None, date_to=None):
+        """Return the cumulated figures of projects at each snapshot period.
+
+        Figures are rebuilt by summing the per-snapshot changes, so the cost
+        is proportional to the number of snapshots in the projects.
+
+        :return: list of dicts with ``period`` and the ``SNAPSHOT_FIELDS`` totals
+        """
+        if not project_ids:
+            return []
+        self.flush_model()
+        cumulated = ', '.join(
+            f'SUM(SUM({delta})) OVER (ORDER BY period) AS {fname}' for fname, delta in SNAPSHOT_FIELDS.items()
+        )
+        query = f"""
+            SELECT period, {cumulated}
+              FROM project_cost_sheet_snapshot
+             WHERE project_id IN %(project_ids)s
+        """
+        if date_to:
+            query += " AND period <= %(date_to)s"
+        query += " GROUP BY period ORDER BY period"
+        self.env.cr.execute(query, {'project_ids': tuple(project_ids), 'date_to': date_to})
+        return [
+            row for row in self.env.cr.dictfetchall()
+            if not date_from or row['period'] >= fields.Date.to_date(date_from)
+        ]
+
+    @api.model
+    def _get_threshold_crossings(self, line_ids, threshold=80.0):
+        """Return the first period at which each line reached ``threshold`` percent.
+
+        :return: dict mapping line ids to dates
+        """
+        if not line_ids:
+            return {}
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT line_id, MIN(period)
+              FROM project_cost_sheet_snapshot
+             WHERE line_id IN %s
+               AND consumption >= %s
+             GROUP BY line_id
+        """, [tuple(line_ids), threshold])
+        return dict(self.env.cr.fetchall())
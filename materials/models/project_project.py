@@ -0,0 +1,38 @@
+from odoo import api, fields, models
+from odoo.tools import float_compare
+
+
+class Project(models.Model):
+    _inherit = 'project.project'
+
+    cost_sheet_ids = fields.One2many('project.cost.sheet', 'project_id', 'Cost Sheets')
+    budget_budgeted_cost = fields.Monetary('Budgeted Cost', compute='_compute_budget_kpis', store=True)
+    budget_committed_amount = fields.Monetary('Committed Amount', compute='_compute_budget_kpis', store=True)
+    budget_actual_amount = fields.Monetary('Actual Amount', compute='_compute_budget_kpis', store=True)
+    budget_remaining = fields.Monetary('Remaining Budget', compute='_compute_budget_kpis', store=True)
+    budget_consumed_percent = fields.Float('Budget Consumed (%)', compute='_compute_budget_kpis', store=True,
+                                           aggregator='avg')
+    is_over_budget = fields.Boolean('Over Budget', compute='_compute_budget_kpis', store=True, index=True)
+
+    @api.depends('cost_sheet_ids.state', 'cost_sheet_ids.total_budgeted_cost', 'cost_sheet_ids.total_committed_amount',
+                 'cost_sheet_ids.total_actual_amount', 'cost_sheet_ids.total_remaining_budget')
+    def _compute_budget_kpis(self):
+        # The stored sheet totals of every project are summed in one query
+        totals = {
+            project: aggregates
+            for project, *aggregates in self.env['project.cost.sheet']._read_group(
+                [('project_id', 'in', self.filtered('id').ids), ('state', '!=', 'draft')],
+                ['project_id'],
+                ['total_budgeted_cost:sum', 'total_committed_amount:sum', 'total_actual_amount:sum',
+                 'total_remaining_budget:sum'],
+            )
+        }
+        for project in self:
+            budgeted, committed, actual, remaining = totals.get(project, (0.0, 0.0, 0.0, 0.0))
+            project.budget_budgeted_cost = budgeted
+            project.budget_committed_amount = committed
+            project.budget_actual_amount = actual
+            project.budget_remaining = remaining
+            project.budget_consumed_percent = 100.0 * (committed + actual) / budgeted if budgeted else 0.0
+            project.is_over_budget = float_compare(
+                remaining, 0.0, precision_rounding=project.currency_id.rounding or 0.01) < 0
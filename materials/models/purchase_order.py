@@ -1,5 +1,19 @@
+from contextlib import contextmanager
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+
+# Purchase order line fields feeding the budget reservation ledger
+RESERVATION_SOURCE_FIELDS = {
+    'order_id', 'product_id', 'product_qty', 'price_unit', 'discount', 'taxes_id', 'cost_sheet_line_id',
+}
+
+# Purchase order line fields feeding the committed figures of cost sheet lines
+COMMITTED_SOURCE_FIELDS = {
+    'order_id', 'product_id', 'product_qty', 'product_uom', 'price_unit', 'discount', 'taxes_id',
+    'analytic_distribution',
+}
 
 
 class PurchaseOrder(models.Model):
@@ -12,6 +26,15 @@ class PurchaseOrder(models.Model):
     def _compute_budget_warning(self):
         for order in self:
             order.budget_warning = any(line.budget_status == 'overrun' for line in order.order_line)
+
+    def write(self, vals):
+        if 'state' not in vals:
+            return super().write(vals)
+        # Confirming or cancelling an order adds or removes its committed amounts
+        with self.order_line._sync_committed_amounts():
+            res = super().write(vals)
+        self.order_line._sync_budget_reservations()
+        return res
     
     def action_view_budget(self):
         """Open a popup showing only the relevant cost sheet lines for this order"""
@@ -35,48 +58,212 @@ class PurchaseOrder(models.Model):
     @api.onchange('project_id')
     def _onchange_project_id(self):
         """When project changes, reset cost sheet lines on order lines"""
-        for line in self.order_line:
-            if self.project_id:
-                line._onchange_product_project()
-            else:
+        if not self.project_id:
+            for line in self.order_line:
                 line.cost_sheet_line_id = False
+            return
+        # Resolve every order line in a single query
+        line_ids = self.env['project.cost.sheet.line']._resolve_active_line_ids(
+            (self.project_id.id, line.product_id.id) for line in self.order_line
+        )
+        for line in self.order_line.filtered('product_id'):
+            line.cost_sheet_line_id = line_ids.get((self.project_id.id, line.product_id.id), False)
 
 
 class PurchaseOrderLine(models.Model):
     _inherit = 'purchase.order.line'
 
-    cost_sheet_line_id = fields.Many2one('project.cost.sheet.line', string='Cost Sheet Line')
+    cost_sheet_line_id = fields.Many2one('project.cost.sheet.line', string='Cost Sheet Line', index=True)
     project_id = fields.Many2one('project.project', related='order_id.project_id', store=True)
+    reserved_cost_sheet_line_id = fields.Many2one('project.cost.sheet.line', string='Reserved On',
+                                                  readonly=True, copy=False)
+    reserved_quantity = fields.Float('Reserved Qty', readonly=True, copy=False)
+    reserved_amount = fields.Monetary('Reserved Amount', readonly=True, copy=False)
     budget_status = fields.Selection([
         ('ok', 'OK'),
         ('warning', 'Warning'),
         ('overrun', 'Budget Overrun')
     ], string='Budget Status', compute='_compute_budget_status', store=True)
 
-    @api.depends('product_id', 'product_qty', 'price_unit', 'price_subtotal', 'cost_sheet_line_id')
+    def init(self):
+        super().init()
+        # Partial: the export skips purchase lines without a cost sheet line
+        create_index(self.env.cr, 'purchase_order_line_budget_write_date_id_index', self._table,
+                     ['write_date', 'id'], where='cost_sheet_line_id IS NOT NULL')
+
+    @api.depends('product_id', 'product_qty', 'price_unit', 'price_subtotal', 'cost_sheet_line_id',
+                 'reserved_cost_sheet_line_id', 'reserved_quantity', 'reserved_amount')
     def _compute_budget_status(self):
-        for line in self:
-            if not line.cost_sheet_line_id:
-                line.budget_status = 'ok'
-                continue
+        with self.env['project.budget.refresh.run']._record('purchase_status', self):
+            for line in self:
+                if not line.cost_sheet_line_id:
+                    line.budget_status = 'ok'
+                    continue
                 
-            cost_line = line.cost_sheet_line_id
-            status = 'ok'
+                cost_line = line.cost_sheet_line_id
+                status = 'ok'
+
+                # Consumption of the other orders plus this line at its current values
+                consumed_quantity = cost_line.reserved_quantity + line.product_qty
+                consumed_amount = cost_line.reserved_amount + line.price_subtotal
+                if line.reserved_cost_sheet_line_id == cost_line:
+                    consumed_quantity -= line.reserved_quantity
+                    consumed_amount -= line.reserved_amount
             
-            # Check if quantities exceed the budgeted quantity
-            if line.product_qty > cost_line.quantity:
-                status = 'overrun'
-            # Check if unit price exceeds the budgeted unit cost
-            elif line.price_unit > cost_line.unit_cost:
-                status = 'overrun'
-            # Check if line untaxed subtotal exceeds the budgeted amount
-            elif line.price_subtotal > cost_line.budgeted_cost:
-                status = 'overrun'
-            # Warning at 80% utilization of budget
-            elif line.price_subtotal >= (cost_line.budgeted_cost * 0.8):
-                status = 'warning'
+                # Check if quantities exceed the budgeted quantity
+                if consumed_quantity > cost_line.quantity:
+                    status = 'overrun'
+                # Check if unit price exceeds the budgeted unit cost
+                elif line.price_unit > cost_line.unit_cost:
+                    status = 'overrun'
+                # Check if untaxed subtotals exceed the budgeted amount
+                elif consumed_amount > cost_line.budgeted_cost:
+                    status = 'overrun'
+                # Warning at 80% utilization of budget
+                elif consumed_amount >= (cost_line.budgeted_cost * 0.8):
+                    status = 'warning'
                 
-            line.budget_status = status
+                line.budget_status = status
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        if self.env.context.get('skip_budget_sync'):
+            return lines
+        if self.env['project.cost.sheet.line']._is_refresh_deferred():
+            self.env['project.cost.sheet.refresh.queue']._enqueue(
+                lines._get_committed_candidate_lines(), committed=True)
+        else:
+            cost_lines, totals = lines._get_committed_contributions()
+            cost_lines._apply_committed_contributions({}, totals)
+        lines._sync_budget_reservations()
+        return lines
+
+    def write(self, vals):
+        if not COMMITTED_SOURCE_FIELDS.intersection(vals):
+            res = super().write(vals)
+        else:
+            with self._sync_committed_amounts():
+                res = super().write(vals)
+        if RESERVATION_SOURCE_FIELDS.intersection(vals):
+            self._sync_budget_reservations()
+        return res
+
+    def unlink(self):
+        self._sync_budget_reservations(release_all=True)
+        with self._sync_committed_amounts():
+            return super().unlink()
+
+    def _sync_cost_sheet_line_links(self, previous_lines):
+        """Bring reservations up to date after a mass link of ``self``."""
+        self._sync_budget_reservations()
+
+    def _sync_budget_reservations(self, release_all=False):
+        """Post the ledger entries bringing each line's reservation up to date.
+
+        Lines of confirmed orders reserve their quantity and untaxed subtotal
+        on their cost sheet line; any other line releases what it reserved.
+        Edits post the difference only, and moving a line to another cost
+        sheet line releases the old reservation before reserving the new one.
+
+        :param release_all: release every reservation, e.g. before deletion
+        """
+        entries = []
+        reserved_values = []
+        for line in self:
+            target = line.cost_sheet_line_id \
+                if not release_all and line.order_id.state in ('purchase', 'done') else line.cost_sheet_line_id.browse()
+            quantity = line.product_qty if target else 0.0
+            amount = line.price_subtotal if target else 0.0
+            reserved = line.reserved_cost_sheet_line_id
+            if reserved == target and not line.currency_id.compare_amounts(line.reserved_amount, amount) \
+                    and line.reserved_quantity == quantity:
+                continue
+            values = {'purchase_line_id': line.id, 'order_id': line.order_id.id}
+            if reserved and reserved != target:
+                entries.append(dict(values, cost_sheet_line_id=reserved.id, move_type='release',
+                                    quantity=-line.reserved_quantity, amount=-line.reserved_amount))
+            elif reserved:
+                quantity_delta = quantity - line.reserved_quantity
+                amount_delta = amount - line.reserved_amount
+                entries.append(dict(values, cost_sheet_line_id=reserved.id,
+                                    move_type='reserve' if amount_delta >= 0 and quantity_delta >= 0 else 'release',
+                                    quantity=quantity_delta, amount=amount_delta))
+            if target and reserved != target:
+                entries.append(dict(values, cost_sheet_line_id=target.id, move_type='reserve',
+                                    quantity=quantity, amount=amount))
+            if not release_all:
+                reserved_values.append((line.id, target.id or None, quantity, amount))
+        if reserved_values:
+            self._write_reserved_values(reserved_values)
+        self.env['project.budget.reservation']._post(entries)
+
+    def _write_reserved_values(self, reserved_values):
+        """Store the reservation state of many lines with a single query.
+
+        :param reserved_values: list of ``(line id, cost sheet line id,
+            quantity, amount)`` tuples
+        """
+        lines = self.browse([values[0] for values in reserved_values])
+        fnames = ['reserved_cost_sheet_line_id', 'reserved_quantity', 'reserved_amount']
+        lines.flush_recordset(fnames)
+        self.env.cr.execute(f"""
+            UPDATE purchase_order_line line
+               SET reserved_cost_sheet_line_id = reserved.cost_sheet_line_id::int,
+                   reserved_quantity = reserved.quantity,
+                   reserved_amount = reserved.amount,
+                   write_uid = %s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM (VALUES {', '.join(['%s'] * len(reserved_values))})
+                   AS reserved(id, cost_sheet_line_id, quantity, amount)
+             WHERE line.id = reserved.id
+        """, [self.env.uid, *reserved_values])
+        lines.invalidate_recordset(fnames + ['write_uid', 'write_date'])
+        lines.modified(fnames)
+
+    def _get_committed_candidate_lines(self):
+        """Return the cost sheet lines the confirmed lines of ``self`` may feed."""
+        lines = self.filtered(lambda line: line.order_id.state in ('purchase', 'done'))
+        account_ids = {
+            int(account_id)
+            for line in lines
+            for key in line.analytic_distribution or {}
+            for account_id in key.split(',')
+            if account_id
+        }
+        projects = self.env['project.project'].search([('account_id', 'in', list(account_ids))]) \
+            if account_ids else self.env['project.project']
+        return self.env['project.cost.sheet.line']._get_candidate_lines(projects.ids, lines.product_id.ids)
+
+    def _get_committed_contributions(self):
+        """Return what the confirmed lines of ``self`` add to cost sheet lines.
+
+        :return: tuple of the candidate cost sheet lines and the
+            ``_get_committed_totals`` result restricted to ``self``
+        """
+        cost_lines = self._get_committed_candidate_lines()
+        return cost_lines, cost_lines._get_committed_totals(po_line_ids=self.ids)
+
+    @contextmanager
+    def _sync_committed_amounts(self):
+        """Apply the committed deltas caused by the changes made in the block.
+
+        In deferred mode the affected cost sheet lines are queued for the
+        background refresh instead.
+        """
+        if self.env.context.get('skip_budget_sync') or not self:
+            yield
+            return
+        if self.env['project.cost.sheet.line']._is_refresh_deferred():
+            cost_lines = self._get_committed_candidate_lines()
+            yield
+            self.env['project.cost.sheet.refresh.queue']._enqueue(
+                cost_lines | self.exists()._get_committed_candidate_lines(), committed=True)
+            return
+        cost_lines_before, before = self._get_committed_contributions()
+        yield
+        cost_lines_after, after = self.exists()._get_committed_contributions()
+        (cost_lines_before | cost_lines_after)._apply_committed_contributions(before, after)
 
     @api.onchange('product_id', 'project_id')
     def _onchange_product_project(self):
@@ -84,12 +271,7 @@ class PurchaseOrderLine(models.Model):
             return
             
         # Find related cost sheet line
-        domain = [
-            ('cost_sheet_id.project_id', '=', self.project_id.id),
-            ('product_id', '=', self.product_id.id),
-            ('cost_sheet_id.state', '=', 'in_progress')
-        ]
-        cost_sheet_line = self.env['project.cost.sheet.line'].search(domain, limit=1)
+        cost_sheet_line = self.env['project.cost.sheet.line']._find_active_line(self.project_id, self.product_id)
         if cost_sheet_line:
             self.cost_sheet_line_id = cost_sheet_line.id
         else:
@@ -98,12 +280,7 @@ class PurchaseOrderLine(models.Model):
     def find_cost_sheet_line(self):
         """Button action to find matching cost sheet line"""
         for line in self:
-            domain = [
-                ('cost_sheet_id.project_id', '=', line.project_id.id),
-                ('product_id', '=', line.product_id.id),
-                ('cost_sheet_id.state', '=', 'in_progress')
-            ]
-            cost_sheet_line = self.env['project.cost.sheet.line'].search(domain, limit=1)
+            cost_sheet_line = self.env['project.cost.sheet.line']._find_active_line(line.project_id, line.product_id)
             if cost_sheet_line:
                 line.cost_sheet_line_id = cost_sheet_line.id
                 # Create a detailed success message
@@ -141,3 +318,8 @@ class PurchaseOrderLine(models.Model):
                         'sticky': False,
                     }
                 }
+
+    def action_link_cost_sheet_lines(self):
+        """Server action linking the selected lines to their cost sheet lines"""
+        summary = self.env['project.cost.sheet.line']._link_source_lines(self)
+        return self.env['project.cost.sheet.link.wizard']._notify_link_summary(summary)
@@ -0,0 +1,57 @@
+from odoo import api, fields, models
+
+# Stock move fields the quantities of stock request lines are computed from
+REQUEST_QUANTITY_FIELDS = {'state', 'product_uom_qty', 'quantity', 'product_uom', 'stock_request_line_id'}
+
+
+class StockPicking(models.Model):
+    _inherit = 'stock.picking'
+
+    stock_request_id = fields.Many2one('stock.request', 'Stock Request', index='btree_not_null',
+                                       readonly=True, copy=False)
+
+    def _create_backorder(self, backorder_moves=None):
+        backorders = super()._create_backorder(backorder_moves=backorder_moves)
+        # The request link is not copied, so that returns and duplicated
+        # transfers stay out of the request quantities
+        for backorder in backorders.filtered(lambda picking: picking.backorder_id.stock_request_id):
+            backorder.stock_request_id = backorder.backorder_id.stock_request_id
+        return backorders
+
+    def _action_done(self):
+        res = super()._action_done()
+        # Settle the quantities of the validated pickings in one aggregation
+        self.env['stock.request.line']._process_pending_move_quantities()
+        return res
+
+
+class StockMove(models.Model):
+    _inherit = 'stock.move'
+
+    stock_request_line_id = fields.Many2one('stock.request.line', 'Stock Request Line', index='btree_not_null',
+                                            readonly=True, copy=False, ondelete='set null')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super().create(vals_list)
+        moves.stock_request_line_id._mark_move_quantities_pending()
+        return moves
+
+    def write(self, vals):
+        request_lines = self.stock_request_line_id if REQUEST_QUANTITY_FIELDS.intersection(vals) else None
+        res = super().write(vals)
+        if request_lines is not None:
+            (request_lines | self.stock_request_line_id)._mark_move_quantities_pending()
+        return res
+
+    def _prepare_move_split_vals(self, qty):
+        vals = super()._prepare_move_split_vals(qty)
+        # The remaining quantity of a partially done move still serves the request line
+        vals['stock_request_line_id'] = self.stock_request_line_id.id
+        return vals
+
+    def unlink(self):
+        request_lines = self.stock_request_line_id
+        res = super().unlink()
+        request_lines._mark_move_quantities_pending()
+        return res
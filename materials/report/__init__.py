@@ -0,0 +1 @@
+from . import budget_report
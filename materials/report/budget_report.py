@@ -0,0 +1,166 @@
+from odoo import api, fields, models
+
+
+class BudgetReport(models.Model):
+    _name = 'project.budget.report'
+    _description = 'Budget Analysis Report'
+    _auto = False
+    _rec_name = 'cost_sheet_line_id'
+    _order = 'date desc, project_id, cost_code'
+
+    date = fields.Date('Month', readonly=True)
+    project_id = fields.Many2one('project.project', 'Project', readonly=True)
+    cost_sheet_id = fields.Many2one('project.cost.sheet', 'Cost Sheet', readonly=True)
+    cost_sheet_line_id = fields.Many2one('project.cost.sheet.line', 'Cost Sheet Line', readonly=True)
+    product_id = fields.Many2one('product.product', 'Product', readonly=True)
+    cost_code = fields.Char('Cost Code', readonly=True)
+    cost_type = fields.Selection([
+        ('material', 'Material'),
+    ], string='Cost Type', readonly=True)
+    company_id = fields.Many2one('res.company', 'Company', readonly=True)
+    currency_id = fields.Many2one('res.currency', related='company_id.currency_id')
+    budgeted_cost = fields.Monetary('Budgeted Cost', readonly=True)
+    committed_quantity = fields.Float('Committed Qty', readonly=True)
+    committed_amount = fields.Monetary('Committed Amount', readonly=True)
+    actual_amount = fields.Monetary('Actual Amount', readonly=True)
+    remaining_budget = fields.Monetary('Remaining Budget', readonly=True)
+
+    def _query(self):
+        """Monthly budget, committed and actual figures per cost sheet line.
+
+        Committed and actual figures are matched to cost sheet lines the same
+        way as the refresh engines of ``project.cost.sheet.line``, and like
+        them converted into the unit of the cost sheet line and the currency
+        of its company at the date of the source document.
+        """
+        def order_rate(currency):
+            return self._select_rate(currency, 'company.id', 'COALESCE(po.date_approve, po.date_order)::date')
+
+        def analytic_rate(currency):
+            return self._select_rate(currency, 'company.id', 'aal.date')
+
+        return f"""
+            WITH figures AS (
+                SELECT line.id AS cost_sheet_line_id,
+                       date_trunc('month', sheet.date)::date AS date,
+                       line.budgeted_cost AS budgeted_cost,
+                       0.0 AS committed_quantity,
+                       0.0 AS committed_amount,
+                       0.0 AS actual_amount
+                  FROM project_cost_sheet_line line
+                  JOIN project_cost_sheet sheet ON sheet.id = line.cost_sheet_id
+
+                 UNION ALL
+
+                SELECT line.id,
+                       date_trunc('month', COALESCE(po.date_approve, po.date_order))::date,
+                       0.0,
+                       pol.product_qty * dist.value::float / 100.0
+                           * CASE WHEN order_uom.category_id = line_uom.category_id
+                                  THEN line_uom.factor / order_uom.factor
+                                  ELSE 1.0 END,
+                       pol.price_subtotal * dist.value::float / 100.0
+                           * CASE WHEN po.currency_id = company.currency_id THEN 1.0
+                                  ELSE {order_rate('company.currency_id')} / {order_rate('po.currency_id')}
+                                  END,
+                       0.0
+                  FROM purchase_order_line pol
+                  JOIN purchase_order po ON po.id = pol.order_id
+                 CROSS JOIN LATERAL jsonb_each_text(pol.analytic_distribution) AS dist(key, value)
+                  JOIN project_cost_sheet_line line ON line.product_id = pol.product_id
+                  JOIN project_project project ON project.id = line.project_id
+                  JOIN project_cost_sheet sheet ON sheet.id = line.cost_sheet_id
+                  JOIN res_company company ON company.id = sheet.company_id
+             LEFT JOIN uom_uom order_uom ON order_uom.id = pol.product_uom
+             LEFT JOIN uom_uom line_uom ON line_uom.id = line.uom_id
+                 WHERE po.state IN ('purchase', 'done')
+                   AND project.account_id::text = ANY(string_to_array(dist.key, ','))
+                   AND EXISTS (
+                           SELECT 1
+                             FROM account_analytic_account account
+                            WHERE account.id::text = ANY(string_to_array(dist.key, ','))
+                              AND account.cost_type = line.cost_type
+                       )
+                   AND (line.cost_code IS NULL OR EXISTS (
+                           SELECT 1
+                             FROM account_analytic_account account
+                            WHERE account.id::text = ANY(string_to_array(dist.key, ','))
+                              AND account.code = line.cost_code
+                       ))
+
+                 UNION ALL
+
+                SELECT line.id,
+                       date_trunc('month', aal.date)::date,
+                       0.0,
+                       0.0,
+                       0.0,
+                       aal.amount
+                           * CASE WHEN aal.currency_id = company.currency_id THEN 1.0
+                                  ELSE {analytic_rate('company.currency_id')} / {analytic_rate('aal.currency_id')}
+                                  END
+                  FROM account_analytic_line aal
+                  JOIN account_analytic_account account ON account.id = aal.account_id
+                  JOIN project_cost_sheet_line line
+                    ON line.project_id = aal.project_id
+                   AND line.product_id = aal.product_id
+                   AND line.cost_type = account.cost_type
+                   AND (line.cost_code IS NULL OR line.cost_code = account.code)
+                  JOIN project_cost_sheet sheet ON sheet.id = line.cost_sheet_id
+                  JOIN res_company company ON company.id = sheet.company_id
+            )
+            SELECT ROW_NUMBER() OVER (ORDER BY figures.cost_sheet_line_id, figures.date) AS id,
+                   figures.date,
+                   figures.cost_sheet_line_id,
+                   line.cost_sheet_id,
+                   line.project_id,
+                   line.product_id,
+                   line.cost_code,
+                   line.cost_type,
+                   sheet.company_id,
+                   SUM(figures.budgeted_cost) AS budgeted_cost,
+                   SUM(figures.committed_quantity) AS committed_quantity,
+                   SUM(figures.committed_amount) AS committed_amount,
+                   SUM(figures.actual_amount) AS actual_amount,
+                   SUM(figures.budgeted_cost - figures.committed_amount - figures.actual_amount) AS remaining_budget
+              FROM figures
+              JOIN project_cost_sheet_line line ON line.id = figures.cost_sheet_line_id
+              JOIN project_cost_sheet sheet ON sheet.id = line.cost_sheet_id
+             GROUP BY figures.cost_sheet_line_id, figures.date, line.cost_sheet_id, line.project_id,
+                      line.product_id, line.cost_code, line.cost_type, sheet.company_id
+        """
+
+    @api.model
+    def _select_rate(self, currency, company, date):
+        """SQL expression of a currency rate, picked like ``res.currency._get_rates``."""
+        return f"""COALESCE((SELECT rate.rate
+                                 FROM res_currency_rate rate
+                                WHERE rate.currency_id = {currency}
+                                  AND rate.name <= {date}
+                                  AND (rate.company_id IS NULL OR rate.company_id = {company})
+                                ORDER BY rate.company_id, rate.name DESC
+                                LIMIT 1), 1.0)"""
+
+    def init(self):
+        self.env.cr.execute("DROP MATERIALIZED VIEW IF EXISTS %s CASCADE" % self._table)
+        self.env.cr.execute("CREATE MATERIALIZED VIEW %s AS (%s)" % (self._table, self._query()))
+        # Required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+        self.env.cr.execute(
+            "CREATE UNIQUE INDEX %s_line_date_index ON %s (cost_sheet_line_id, date)" % (self._table, self._table))
+        self.env.cr.execute("CREATE INDEX %s_project_date_index ON %s (project_id, date)" % (self._table, self._table))
+
+    @api.model
+    def _refresh(self, concurrently=True):
+        """Rebuild the report data.
+
+        A concurrent refresh keeps the report readable while it runs.
+        """
+        self.env.flush_all()
+        self.env.cr.execute("REFRESH MATERIALIZED VIEW %s %s" % ('CONCURRENTLY' if concurrently else '', self._table))
+        self.invalidate_model()
+        return True
+
+    @api.model
+    def action_refresh(self):
+        self._refresh()
+        return {'type': 'ir.actions.client', 'tag': 'reload'}
@@ -0,0 +1,13 @@
+from . import test_budget_conversion
+from . import test_budget_refresh_run
+from . import test_budget_report
+from . import test_budget_reservation
+from . import test_cost_sheet_closing
+from . import test_cost_sheet_import
+from . import test_cost_sheet_link
+from . import test_cost_sheet_revision
+from . import test_cost_sheet_snapshot
+from . import test_export
+from . import test_performance
+from . import test_project_budget
+from . import test_stock_request
@@ -0,0 +1,158 @@
+import math
+import time
+from contextlib import contextmanager
+
+from odoo import Command
+from odoo.tests import TransactionCase
+
+
+class MaterialBudgetPerformanceCommon(TransactionCase):
+    """Base class generating synthetic budget data of any size.
+
+    Subclasses call ``_generate_dataset`` with the number of cost sheet
+    lines they need and measure the paths under test with
+    ``assertQueryBudget``.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        cls.partner = cls.env['res.partner'].create({'name': 'Budget Test Vendor'})
+        cls.project_plan = cls.env['account.analytic.plan'].create({'name': 'Budget Test Projects'})
+        cls.cost_code_plan = cls.env['account.analytic.plan'].create({'name': 'Budget Test Cost Codes'})
+        cls.cost_code_accounts = cls.env['account.analytic.account'].create([
+            {
+                'name': f'Cost Code {index:03d}',
+                'code': f'CC{index:03d}',
+                'plan_id': cls.cost_code_plan.id,
+                'cost_type': 'material',
+            }
+            for index in range(20)
+        ])
+
+    def _generate_dataset(self, n_lines, n_projects=1, order_size=50, analytic_lines_per_line=2, request_size=20):
+        """Create projects, in-progress cost sheets and their source documents.
+
+        Every cost sheet line gets a matching line on a confirmed purchase
+        order with a (project, cost code) analytic distribution, analytic
+        lines on its cost code account, and a stock request line.
+
+        :return: dict with the created records
+        """
+        lines_per_project = math.ceil(n_lines / n_projects)
+        products = self.env['product.product'].create([
+            {'name': f'Budget Material {index}', 'default_code': f'BM{index:06d}', 'type': 'consu'}
+            for index in range(lines_per_project)
+        ])
+        project_accounts = self.env['account.analytic.account'].create([
+            {'name': f'Budget Project {index}', 'plan_id': self.project_plan.id}
+            for index in range(n_projects)
+        ])
+        projects = self.env['project.project'].create([
+            {'name': account.name, 'account_id': account.id} for account in project_accounts
+        ])
+        sheets = self.env['project.cost.sheet'].create([
+            {
+                'project_id': project.id,
+                'state': 'in_progress',
+                'line_ids': [
+                    Command.create({
+                        'product_id': product.id,
+                        'cost_code': self.cost_code_accounts[index % len(self.cost_code_accounts)].code,
+                        'quantity': 100.0,
+                        'unit_cost': 10.0,
+                    })
+                    for index, product in enumerate(products)
+                ],
+            }
+            for project in projects
+        ])
+        cost_lines = sheets.line_ids
+
+        orders = self.env['purchase.order'].create([
+            {
+                'partner_id': self.partner.id,
+                'project_id': project.id,
+                'order_line': [
+                    Command.create({
+                        'product_id': cost_line.product_id.id,
+                        'product_qty': 10.0,
+                        'price_unit': 9.0,
+                        'cost_sheet_line_id': cost_line.id,
+                        'analytic_distribution': {
+                            f'{project.account_id.id},{self._get_cost_code_account(cost_line).id}': 100,
+                        },
+                    })
+                    for cost_line in chunk
+                ],
+            }
+            for project, sheet in zip(projects, sheets)
+            for chunk in self._chunks(sheet.line_ids, order_size)
+        ])
+        orders.write({'state': 'purchase'})
+
+        analytic_lines = self.env['account.analytic.line'].create([
+            {
+                'name': f'Consumption {cost_line.product_id.default_code}',
+                'account_id': self._get_cost_code_account(cost_line).id,
+                'project_id': cost_line.project_id.id,
+                'product_id': cost_line.product_id.id,
+                'amount': 25.0,
+            }
+            for cost_line in cost_lines
+            for __ in range(analytic_lines_per_line)
+        ])
+
+        requests = self.env['stock.request'].create([
+            {
+                'project_id': sheet.project_id.id,
+                'line_ids': [
+                    Command.create({
+                        'product_id': cost_line.product_id.id,
+                        'quantity': 5.0,
+                        'cost_sheet_line_id': cost_line.id,
+                    })
+                    for cost_line in chunk
+                ],
+            }
+            for sheet in sheets
+            for chunk in self._chunks(sheet.line_ids, request_size)
+        ])
+        self.env.flush_all()
+        return {
+            'products': products,
+            'projects': projects,
+            'sheets': sheets,
+            'cost_lines': cost_lines,
+            'orders': orders,
+            'analytic_lines': analytic_lines,
+            'requests': requests,
+        }
+
+    def _get_cost_code_account(self, cost_line):
+        return self.cost_code_accounts.filtered(lambda account: account.code == cost_line.cost_code)[:1]
+
+    @staticmethod
+    def _chunks(records, size):
+        return [records[index:index + size] for index in range(0, len(records), size)]
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_seconds):
+        """Check the queries and wall time spent in the block, caches cold.
+
+        The measured values are available in the yielded dict afterwards.
+        """
+        self.env.flush_all()
+        self.env.invalidate_all()
+        measures = {}
+        start_count = self.env.cr.sql_log_count
+        start = time.perf_counter()
+        yield measures
+        self.env.flush_all()
+        measures['queries'] = self.env.cr.sql_log_count - start_count
+        measures['seconds'] = time.perf_counter() - start
+        self.assertLessEqual(measures['queries'], max_queries,
+                             f"{measures['queries']} queries issued, {max_queries} allowed")
+        self.assertLessEqual(measures['seconds'], max_seconds,
+                             f"{measures['seconds']:.2f}s spent, {max_seconds}s allowed")
@@ -0,0 +1,85 @@
+from odoo import Command, fields
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestBudgetConversion(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        cls.product = cls.env['product.product'].create({'name': 'Converted Material', 'type': 'consu'})
+        project_plan = cls.env['account.analytic.plan'].create({'name': 'Conversion Projects'})
+        cost_code_plan = cls.env['account.analytic.plan'].create({'name': 'Conversion Cost Codes'})
+        cls.project_account = cls.env['account.analytic.account'].create({
+            'name': 'Conversion Project', 'plan_id': project_plan.id,
+        })
+        cls.cost_code_account = cls.env['account.analytic.account'].create({
+            'name': 'Conversion Cost Code', 'code': 'CV001', 'plan_id': cost_code_plan.id, 'cost_type': 'material',
+        })
+        cls.project = cls.env['project.project'].create({
+            'name': 'Conversion Project', 'account_id': cls.project_account.id,
+        })
+        cls.sheet = cls.env['project.cost.sheet'].create({
+            'project_id': cls.project.id,
+            'state': 'in_progress',
+            'line_ids': [Command.create({
+                'product_id': cls.product.id,
+                'cost_code': 'CV001',
+                'quantity': 500.0,
+                'unit_cost': 10.0,
+            })],
+        })
+        cls.cost_line = cls.sheet.line_ids
+        cls.partner = cls.env['res.partner'].create({'name': 'Conversion Vendor'})
+
+        # Twice, then four times the value of the company currency
+        company = cls.env.company
+        cls.currency = cls.env['res.currency'].create({
+            'name': 'CVX',
+            'symbol': 'C',
+            'rate_ids': [
+                Command.create({
+                    'name': date,
+                    'rate': factor * company.currency_id._get_rates(company, date)[company.currency_id.id],
+                    'company_id': company.id,
+                })
+                for date, factor in ((fields.Date.to_date('2020-01-01'), 2.0), (fields.Date.to_date('2021-01-01'), 4.0))
+            ],
+        })
+
+    def _create_order(self, date_approve, **line_vals):
+        order = self.env['purchase.order'].create({
+            'partner_id': self.partner.id,
+            'project_id': self.project.id,
+            'currency_id': self.currency.id,
+            'order_line': [Command.create({
+                'product_id': self.product.id,
+                'product_qty': 10.0,
+                'price_unit': 9.0,
+                'analytic_distribution': {f'{self.project_account.id},{self.cost_code_account.id}': 100},
+                **line_vals,
+            })],
+        })
+        order.button_confirm()
+        order.with_context(skip_budget_sync=True).date_approve = date_approve
+        return order
+
+    def test_rates_of_the_order_date(self):
+        self._create_order('2020-06-01 12:00:00')
+        self._create_order('2021-06-01 12:00:00')
+        self.cost_line.write({'committed_quantity': 0.0, 'committed_amount': 0.0})
+        self.cost_line._refresh_committed_amounts()
+        # Each order is converted with the rate of its own day: 90 / 2 + 90 / 4
+        self.assertAlmostEqual(self.cost_line.committed_quantity, 20.0)
+        self.assertAlmostEqual(self.cost_line.committed_amount, 67.5)
+
+    def test_unit_of_measure(self):
+        self._create_order('2020-06-01 12:00:00', product_uom=self.env.ref('uom.product_uom_dozen').id)
+        self._create_order('2021-06-01 12:00:00')
+        self.cost_line.write({'committed_quantity': 0.0, 'committed_amount': 0.0})
+        self.cost_line._refresh_committed_amounts()
+        # Ten dozens and ten units, in the unit of the cost sheet line
+        self.assertAlmostEqual(self.cost_line.committed_quantity, 130.0)
+        self.assertAlmostEqual(self.cost_line.committed_amount, 67.5)
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from odoo import Command, fields
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestBudgetRefreshRun(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        product = cls.env['product.product'].create({'name': 'Profiled Material', 'type': 'consu'})
+        project = cls.env['project.project'].create({'name': 'Profiled Project'})
+        cls.sheet = cls.env['project.cost.sheet'].create({
+            'project_id': project.id,
+            'line_ids': [Command.create({'product_id': product.id, 'quantity': 1.0, 'unit_cost': 1.0})],
+        })
+        cls.Run = cls.env['project.budget.refresh.run']
+
+    def _set_param(self, key, value):
+        self.env['ir.config_parameter'].sudo().set_param(key, value)
+
+    def _record_runs(self, count=1):
+        for __ in range(count):
+            with self.Run._record('refresh_actuals', self.sheet.line_ids):
+                pass
+
+    def _get_runs(self):
+        return self.Run.search([('operation', '=', 'refresh_actuals')])
+
+    def test_runs_created_on_commit(self):
+        self._set_param('materials.refresh_profiling', 'on')
+        self._record_runs(3)
+        # Runs wait for the end of the transaction
+        self.assertFalse(self._get_runs())
+        self.env.cr.precommit.run()
+        runs = self._get_runs()
+        self.assertEqual(len(runs), 3)
+        self.assertEqual(set(runs.mapped('record_count')), {1})
+
+    def test_sampled_by_default(self):
+        self.assertEqual(self.Run._get_profiling_mode(), 'sampled')
+        self._set_param('materials.refresh_profiling_sample_rate', '0')
+        self._record_runs(3)
+        self.env.cr.precommit.run()
+        self.assertFalse(self._get_runs())
+        self._set_param('materials.refresh_profiling_sample_rate', '1')
+        self._record_runs(3)
+        self.env.cr.precommit.run()
+        self.assertEqual(len(self._get_runs()), 3)
+
+    def test_off(self):
+        self._set_param('materials.refresh_profiling', 'off')
+        self._record_runs()
+        self.env.cr.precommit.run()
+        self.assertFalse(self._get_runs())
+
+    def test_prune(self):
+        self._set_param('materials.refresh_run_retention_days', '30')
+        now = fields.Datetime.now()
+        old_run, recent_run = self.Run.sudo().create([
+            {'operation': 'refresh_actuals', 'date': now - timedelta(days=31)},
+            {'operation': 'refresh_actuals', 'date': now - timedelta(days=29)},
+        ])
+        self.Run._cron_prune()
+        self.assertFalse(old_run.exists())
+        self.assertTrue(recent_run.exists())
@@ -0,0 +1,95 @@
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestBudgetReport(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        cls.product = cls.env['product.product'].create({'name': 'Report Material', 'type': 'consu'})
+        project_plan = cls.env['account.analytic.plan'].create({'name': 'Report Projects'})
+        cost_code_plan = cls.env['account.analytic.plan'].create({'name': 'Report Cost Codes'})
+        cls.project_account = cls.env['account.analytic.account'].create({
+            'name': 'Report Project', 'plan_id': project_plan.id,
+        })
+        cls.cost_code_account = cls.env['account.analytic.account'].create({
+            'name': 'Report Cost Code', 'code': 'RC001', 'plan_id': cost_code_plan.id, 'cost_type': 'material',
+        })
+        cls.project = cls.env['project.project'].create({
+            'name': 'Report Project', 'account_id': cls.project_account.id,
+        })
+        cls.sheet = cls.env['project.cost.sheet'].create({
+            'project_id': cls.project.id,
+            'state': 'in_progress',
+            'line_ids': [Command.create({
+                'product_id': cls.product.id,
+                'cost_code': 'RC001',
+                'quantity': 100.0,
+                'unit_cost': 10.0,
+            })],
+        })
+        cls.cost_line = cls.sheet.line_ids
+        cls.partner = cls.env['res.partner'].create({'name': 'Report Vendor'})
+
+    def _create_order(self, currency=None, **line_vals):
+        order = self.env['purchase.order'].create({
+            'partner_id': self.partner.id,
+            'project_id': self.project.id,
+            'currency_id': (currency or self.env.company.currency_id).id,
+            'order_line': [Command.create({
+                'product_id': self.product.id,
+                'product_qty': 10.0,
+                'price_unit': 9.0,
+                'analytic_distribution': {f'{self.project_account.id},{self.cost_code_account.id}': 100},
+                **line_vals,
+            })],
+        })
+        order.button_confirm()
+        return order
+
+    def _get_report_totals(self):
+        Report = self.env['project.budget.report']
+        Report._refresh(concurrently=False)
+        [(committed_amount, actual_amount)] = Report._read_group(
+            [('cost_sheet_line_id', '=', self.cost_line.id)],
+            aggregates=['committed_amount:sum', 'actual_amount:sum'],
+        )
+        return committed_amount, actual_amount
+
+    def test_report_matches_engines(self):
+        self._create_order()
+        self.env['account.analytic.line'].create({
+            'name': 'Report Consumption',
+            'account_id': self.cost_code_account.id,
+            'project_id': self.project.id,
+            'product_id': self.product.id,
+            'amount': 25.0,
+        })
+        self.cost_line._refresh_actual_amounts()
+        self.cost_line._refresh_committed_amounts()
+
+        committed_amount, actual_amount = self._get_report_totals()
+        self.assertAlmostEqual(committed_amount, self.cost_line.committed_amount)
+        self.assertAlmostEqual(actual_amount, self.cost_line.actual_amount)
+        self.assertAlmostEqual(committed_amount, 90.0)
+        self.assertAlmostEqual(actual_amount, 25.0)
+
+    def test_report_converts_currency_and_unit(self):
+        currency = self.env['res.currency'].create({
+            'name': 'RPX',
+            'symbol': 'R',
+            'rate_ids': [Command.create({'name': '2020-01-01', 'rate': 2.0, 'company_id': self.env.company.id})],
+        })
+        self._create_order(currency=currency, product_uom=self.env.ref('uom.product_uom_dozen').id)
+        self.cost_line._refresh_committed_amounts()
+
+        committed_amount, __ = self._get_report_totals()
+        [(committed_quantity,)] = self.env['project.budget.report']._read_group(
+            [('cost_sheet_line_id', '=', self.cost_line.id)], aggregates=['committed_quantity:sum'])
+        self.assertAlmostEqual(committed_quantity, self.cost_line.committed_quantity)
+        self.assertAlmostEqual(committed_amount, self.cost_line.committed_amount)
+        self.assertAlmostEqual(committed_quantity, 120.0)
+        self.assertAlmostEqual(committed_amount, 45.0)
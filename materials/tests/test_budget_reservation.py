@@ -0,0 +1,47 @@
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestBudgetReservation(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        cls.product = cls.env['product.product'].create({'name': 'Reserved Material', 'type': 'consu'})
+        cls.project = cls.env['project.project'].create({'name': 'Reservation Project'})
+        cls.sheet = cls.env['project.cost.sheet'].create({
+            'project_id': cls.project.id,
+            'state': 'in_progress',
+            'line_ids': [Command.create({'product_id': cls.product.id, 'quantity': 10.0, 'unit_cost': 5.0})],
+        })
+        cls.cost_line = cls.sheet.line_ids
+        partner = cls.env['res.partner'].create({'name': 'Reservation Vendor'})
+        cls.order = cls.env['purchase.order'].create({
+            'partner_id': partner.id,
+            'project_id': cls.project.id,
+            'order_line': [Command.create({
+                'product_id': cls.product.id,
+                'product_qty': 4.0,
+                'price_unit': 5.0,
+                'cost_sheet_line_id': cls.cost_line.id,
+            })],
+        })
+        cls.order.button_confirm()
+
+    def test_entries_outlive_cost_sheet_line(self):
+        entries = self.env['project.budget.reservation'].search([('cost_sheet_id', '=', self.sheet.id)])
+        self.assertEqual(entries.mapped('quantity'), [4.0])
+        self.assertEqual((self.cost_line.reserved_quantity, self.cost_line.reserved_amount), (4.0, 20.0))
+
+        self.cost_line.unlink()
+        entries = self.env['project.budget.reservation'].search([('cost_sheet_id', '=', self.sheet.id)])
+        # The reservation is released, and the history is kept without its line
+        self.assertEqual(sorted(entries.mapped('move_type')), ['release', 'reserve'])
+        self.assertEqual(sum(entries.mapped('quantity')), 0.0)
+        self.assertFalse(entries.cost_sheet_line_id)
+        self.assertEqual(entries.product_id, self.product)
+        order_line = self.order.order_line
+        self.assertFalse(order_line.reserved_cost_sheet_line_id)
+        self.assertEqual((order_line.reserved_quantity, order_line.reserved_amount), (0.0, 0.0))
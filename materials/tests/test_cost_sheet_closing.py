@@ -0,0 +1,106 @@
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCostSheetClosing(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        cls.product = cls.env['product.product'].create({'name': 'Closed Material', 'type': 'consu'})
+        project_plan = cls.env['account.analytic.plan'].create({'name': 'Closing Projects'})
+        cost_code_plan = cls.env['account.analytic.plan'].create({'name': 'Closing Cost Codes'})
+        cls.project_account = cls.env['account.analytic.account'].create({
+            'name': 'Closing Project', 'plan_id': project_plan.id,
+        })
+        cls.cost_code_account = cls.env['account.analytic.account'].create({
+            'name': 'Closing Cost Code', 'code': 'CL001', 'plan_id': cost_code_plan.id, 'cost_type': 'material',
+        })
+        cls.project = cls.env['project.project'].create({
+            'name': 'Closing Project', 'account_id': cls.project_account.id,
+        })
+        cls.sheet = cls.env['project.cost.sheet'].create({
+            'project_id': cls.project.id,
+            'state': 'in_progress',
+            'line_ids': [Command.create({
+                'product_id': cls.product.id,
+                'cost_code': 'CL001',
+                'quantity': 100.0,
+                'unit_cost': 10.0,
+            })],
+        })
+        cls.cost_line = cls.sheet.line_ids
+        cls.partner = cls.env['res.partner'].create({'name': 'Closing Vendor'})
+        cls.Queue = cls.env['project.cost.sheet.refresh.queue']
+
+    def _confirm_order(self):
+        order = self.env['purchase.order'].create({
+            'partner_id': self.partner.id,
+            'project_id': self.project.id,
+            'order_line': [Command.create({
+                'product_id': self.product.id,
+                'product_qty': 10.0,
+                'price_unit': 9.0,
+                'analytic_distribution': {f'{self.project_account.id},{self.cost_code_account.id}': 100},
+            })],
+        })
+        order.button_confirm()
+        return order
+
+    def _refresh(self):
+        self.sheet.action_update_committed()
+        self.Queue._process_queue()
+
+    def _get_queued_lines(self):
+        return self.Queue.search([('cost_sheet_id', '=', self.sheet.id)]).line_id
+
+    def _close(self, committed_amount):
+        self.sheet.action_done()
+        self.assertTrue(self.sheet.closed_date)
+        self.assertEqual(self.sheet.closed_committed_amount, committed_amount)
+        self.assertFalse(self._get_queued_lines())
+
+        # Orders confirmed while the sheet is closed leave its figures alone
+        self._confirm_order()
+        self._refresh()
+        self.assertFalse(self._get_queued_lines())
+        self.assertEqual(self.cost_line.committed_amount, committed_amount)
+        self.assertEqual(self.sheet.closed_committed_amount, committed_amount)
+
+    def _assert_unfrozen(self, committed_amount):
+        self.assertFalse(self.sheet.closed_date)
+        self.assertEqual(self.sheet.closed_committed_amount, 0.0)
+        # The lines are queued to catch up with the orders of the closed period
+        self.assertEqual(self._get_queued_lines(), self.cost_line)
+        self.Queue._process_queue()
+        self.assertEqual(self.cost_line.committed_amount, committed_amount)
+
+    def test_reopen(self):
+        self._confirm_order()
+        self._refresh()
+        self.assertEqual(self.cost_line.committed_amount, 90.0)
+
+        self._close(90.0)
+        self.sheet.action_reopen()
+        self.assertEqual(self.sheet.state, 'in_progress')
+        self._assert_unfrozen(180.0)
+
+        # A reopened sheet is tracked live again
+        self._confirm_order()
+        self._refresh()
+        self.assertEqual(self.cost_line.committed_amount, 270.0)
+
+    def test_reset_to_draft(self):
+        self._confirm_order()
+        self._refresh()
+
+        self._close(90.0)
+        self.sheet.action_draft()
+        self.assertEqual(self.sheet.state, 'draft')
+        self._assert_unfrozen(180.0)
+
+        self._close(180.0)
+        self.sheet.action_reopen()
+        self._assert_unfrozen(270.0)
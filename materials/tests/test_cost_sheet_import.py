@@ -0,0 +1,97 @@
+import base64
+import io
+from unittest import skipIf
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.tests import TransactionCase, tagged
+
+from ..wizard import cost_sheet_import
+from ..wizard.cost_sheet_import import openpyxl
+
+
+@tagged('post_install', '-at_install')
+class TestCostSheetImport(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        cls.products = cls.env['product.product'].create([
+            {'name': f'Import Material {index}', 'default_code': f'IM{index:03d}', 'type': 'consu'}
+            for index in range(5)
+        ])
+        # Two products sharing a code cannot be told apart by the importer
+        cls.env['product.product'].create([
+            {'name': f'Import Duplicate {index}', 'default_code': 'IMDUP', 'type': 'consu'}
+            for index in range(2)
+        ])
+        cls.project = cls.env['project.project'].create({'name': 'Import Project'})
+
+    def _import(self, content, filename):
+        wizard = self.env['project.cost.sheet.import'].create({
+            'data_file': base64.b64encode(content),
+            'filename': filename,
+            'project_id': self.project.id,
+        })
+        wizard.action_import()
+        return wizard
+
+    def _csv(self, rows):
+        return '\n'.join(','.join(str(cell) for cell in row) for row in rows).encode()
+
+    def test_row_errors(self):
+        rows = [
+            ('Product Code', 'Cost Code', 'Qty', 'Unit Cost'),
+            ('IM000', 'CC001', 10, 5.0),
+            ('', 'CC001', 10, 5.0),
+            ('IMXXX', 'CC001', 10, 5.0),
+            ('IM001', 'CC001', 'ten', 5.0),
+            ('IM002', 'CC001', -1, 5.0),
+            ('IMDUP', 'CC001', 10, 5.0),
+            ('IM003', 'CC002', 4, 2.5),
+        ]
+        wizard = self._import(self._csv(rows), 'estimation.csv')
+        self.assertEqual(wizard.state, 'done')
+        self.assertEqual(wizard.imported_count, 2)
+        self.assertEqual(wizard.error_count, 5)
+        errors = wizard.error_log.splitlines()
+        self.assertEqual([error.split(':')[0] for error in errors], ['Row 3', 'Row 4', 'Row 5', 'Row 6', 'Row 7'])
+        self.assertIn('IMDUP', errors[-1])
+        lines = wizard.cost_sheet_id.line_ids
+        self.assertEqual(lines.product_id, self.products[0] | self.products[3])
+        self.assertEqual(wizard.cost_sheet_id.total_budgeted_cost, 60.0)
+
+    def test_missing_column(self):
+        with self.assertRaises(UserError):
+            self._import(self._csv([('Product Code', 'Qty'), ('IM000', 10)]), 'estimation.csv')
+
+    def test_batches(self):
+        rows = [('default_code', 'quantity', 'unit_cost')] + [
+            (product.default_code, 1, 1.0) for product in self.products
+        ]
+        with patch.object(cost_sheet_import, 'IMPORT_BATCH_SIZE', 2):
+            wizard = self._import(self._csv(rows), 'estimation.csv')
+        self.assertEqual(wizard.imported_count, 5)
+        self.assertEqual(wizard.cost_sheet_id.line_ids.product_id, self.products)
+
+    @skipIf(openpyxl is None, "openpyxl is not installed")
+    def test_xlsx_streaming(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['Internal Reference', 'Cost Type', 'Quantity', 'Price'])
+        for product in self.products:
+            sheet.append([product.default_code, 'material', 3.0, 2.0])
+        sheet.append([None, None, None, None])
+        sheet.append(['IMDUP', 'material', 3.0, 2.0])
+        content = io.BytesIO()
+        workbook.save(content)
+
+        load_workbook = openpyxl.load_workbook
+        with patch.object(openpyxl, 'load_workbook', wraps=load_workbook) as mock_load_workbook:
+            wizard = self._import(content.getvalue(), 'estimation.xlsx')
+        # Rows are streamed from a read-only workbook
+        self.assertTrue(mock_load_workbook.call_args.kwargs['read_only'])
+        self.assertEqual(wizard.imported_count, 5)
+        self.assertEqual(wizard.error_count, 1)
+        self.assertEqual(wizard.cost_sheet_id.total_budgeted_cost, 30.0)
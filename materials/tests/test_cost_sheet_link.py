@@ -0,0 +1,69 @@
+from odoo import Command
+from odoo.exceptions import AccessError
+from odoo.tests import TransactionCase, new_test_user, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCostSheetLink(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        # Matched by one cost sheet line, by two of them, and by none
+        cls.linked_product, cls.ambiguous_product, cls.unmatched_product = cls.env['product.product'].create([
+            {'name': f'Link Material {index}', 'type': 'consu'} for index in range(3)
+        ])
+        cls.project = cls.env['project.project'].create({'name': 'Link Project'})
+        cls.sheet = cls.env['project.cost.sheet'].create({
+            'project_id': cls.project.id,
+            'state': 'in_progress',
+            'line_ids': [
+                Command.create({'product_id': product.id, 'quantity': 10.0, 'unit_cost': 5.0})
+                for product in (cls.linked_product, cls.ambiguous_product, cls.ambiguous_product)
+            ],
+        })
+        cls.cost_line = cls.sheet.line_ids.filtered(lambda line: line.product_id == cls.linked_product)
+        partner = cls.env['res.partner'].create({'name': 'Link Vendor'})
+        cls.order = cls.env['purchase.order'].create({
+            'partner_id': partner.id,
+            'project_id': cls.project.id,
+            'order_line': [
+                Command.create({'product_id': product.id, 'product_qty': 1.0, 'price_unit': 5.0})
+                for product in (cls.linked_product, cls.ambiguous_product, cls.unmatched_product)
+            ],
+        })
+        cls.request = cls.env['stock.request'].create({
+            'project_id': cls.project.id,
+            'line_ids': [
+                Command.create({'product_id': product.id, 'quantity': 1.0})
+                for product in (cls.linked_product, cls.ambiguous_product, cls.unmatched_product)
+            ],
+        })
+
+    def _run_wizard(self, target):
+        wizard = self.env['project.cost.sheet.link.wizard'].create({
+            'target': target,
+            'project_ids': [Command.set(self.project.ids)],
+        })
+        wizard.action_link()
+        return wizard
+
+    def test_link_wizard(self):
+        wizard = self._run_wizard('both')
+        self.assertEqual((wizard.linked_count, wizard.ambiguous_count, wizard.unmatched_count), (2, 2, 2))
+        for lines in (self.order.order_line, self.request.line_ids):
+            self.assertEqual(lines.filtered('cost_sheet_line_id').product_id, self.linked_product)
+            self.assertEqual(lines.cost_sheet_line_id, self.cost_line)
+
+        # Linked lines are left out of the next run
+        wizard = self._run_wizard('purchase')
+        self.assertEqual((wizard.linked_count, wizard.ambiguous_count, wizard.unmatched_count), (0, 1, 1))
+
+    def test_link_requires_write_access(self):
+        user = new_test_user(self.env, login='link_reader', groups='base.group_user')
+        lines = self.order.order_line.with_user(user)
+        # Purchase lines are not writable by internal users without purchase rights
+        with self.assertRaises(AccessError):
+            self.env['project.cost.sheet.line'].with_user(user)._link_source_lines(lines)
+        self.assertFalse(self.order.order_line.cost_sheet_line_id)
@@ -0,0 +1,118 @@
+from odoo import Command
+from odoo.exceptions import AccessError, UserError
+from odoo.tests import TransactionCase, new_test_user, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCostSheetRevision(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        cls.products = cls.env['product.product'].create([
+            {'name': f'Revision Material {index}', 'type': 'consu'} for index in range(3)
+        ])
+        cls.project = cls.env['project.project'].create({'name': 'Revision Project'})
+        cls.sheet = cls.env['project.cost.sheet'].create({
+            'project_id': cls.project.id,
+            'line_ids': [
+                Command.create({'product_id': cls.products[0].id, 'quantity': 10.0, 'unit_cost': 5.0}),
+                # Two lines sharing a product count as one budget line
+                Command.create({'product_id': cls.products[1].id, 'quantity': 4.0, 'unit_cost': 10.0}),
+                Command.create({'product_id': cls.products[1].id, 'quantity': 6.0, 'unit_cost': 20.0}),
+            ],
+        })
+
+    def _budget_vals(self, product, quantity, unit_cost):
+        return {'product_id': product.id, 'cost_code': False, 'quantity': quantity, 'unit_cost': unit_cost}
+
+    def test_duplicated_lines(self):
+        original = self.sheet._get_effective_budget()
+        self.assertEqual(original[self.products[1].id, False], (10.0, 16.0))
+
+        # Unchanged totals of duplicated lines are not a change
+        with self.assertRaises(UserError):
+            self.sheet._revise([
+                self._budget_vals(self.products[0], 10.0, 5.0),
+                self._budget_vals(self.products[1], 10.0, 16.0),
+            ])
+
+        revision = self.sheet._revise([
+            self._budget_vals(self.products[0], 10.0, 5.0),
+            self._budget_vals(self.products[1], 12.0, 16.0),
+        ])
+        self.assertEqual((revision.added_count, revision.updated_count, revision.removed_count), (0, 1, 0))
+        self.assertEqual((revision.line_ids.old_quantity, revision.line_ids.old_unit_cost), (10.0, 16.0))
+        self.assertAlmostEqual(revision.budgeted_delta, 32.0)
+        # The duplicated lines are merged into one
+        lines = self.sheet.line_ids.filtered(lambda line: line.product_id == self.products[1])
+        self.assertEqual((len(lines), lines.quantity, lines.unit_cost), (1, 12.0, 16.0))
+        self.assertEqual(self.sheet._get_effective_budget(0), original)
+
+    def test_direct_edits_blocked(self):
+        self.sheet._revise([
+            self._budget_vals(self.products[0], 20.0, 5.0),
+            self._budget_vals(self.products[1], 10.0, 16.0),
+        ])
+        history = self.sheet._get_effective_budget(0)
+        line = self.sheet.line_ids.filtered(lambda line: line.product_id == self.products[0])
+        with self.assertRaises(UserError):
+            line.quantity = 30.0
+        with self.assertRaises(UserError):
+            line.unlink()
+        with self.assertRaises(UserError):
+            self.env['project.cost.sheet.line'].create({
+                'cost_sheet_id': self.sheet.id, 'product_id': self.products[2].id, 'quantity': 1.0, 'unit_cost': 1.0,
+            })
+        self.assertEqual(self.sheet._get_effective_budget(0), history)
+        self.assertEqual(self.sheet._get_effective_budget()[self.products[0].id, False], (20.0, 5.0))
+
+    def test_budget_diff(self):
+        duplicate_line = self.sheet.line_ids.filtered(lambda line: line.product_id == self.products[1])[1]
+        request = self.env['stock.request'].create({
+            'project_id': self.project.id,
+            'line_ids': [Command.create({
+                'product_id': self.products[1].id, 'quantity': 1.0, 'cost_sheet_line_id': duplicate_line.id,
+            })],
+        })
+        revision = self.sheet._revise([
+            self._budget_vals(self.products[1], 12.0, 16.0),
+            self._budget_vals(self.products[2], 3.0, 7.0),
+        ])
+        self.assertEqual((revision.added_count, revision.updated_count, revision.removed_count), (1, 1, 1))
+        self.assertEqual(revision.line_ids.mapped('change'), ['update', 'add', 'remove'])
+        # Documents of the merged line follow the line it is merged into
+        merged_line = self.sheet.line_ids.filtered(lambda line: line.product_id == self.products[1])
+        self.assertEqual(request.line_ids.cost_sheet_line_id, merged_line)
+
+        change = dict.fromkeys(('old_quantity', 'new_quantity', 'old_unit_cost', 'new_unit_cost'), 0.0)
+        self.assertEqual(self.sheet._get_budget_diff(0, 1), [
+            {**change, 'product_id': self.products[0].id, 'cost_code': False, 'change': 'remove',
+             'old_quantity': 10.0, 'old_unit_cost': 5.0},
+            {**change, 'product_id': self.products[1].id, 'cost_code': False, 'change': 'update',
+             'old_quantity': 10.0, 'new_quantity': 12.0, 'old_unit_cost': 16.0, 'new_unit_cost': 16.0},
+            {**change, 'product_id': self.products[2].id, 'cost_code': False, 'change': 'add',
+             'new_quantity': 3.0, 'new_unit_cost': 7.0},
+        ])
+        self.assertEqual([values['change'] for values in self.sheet._get_budget_diff(1, 0)],
+                         ['add', 'update', 'remove'])
+        self.assertEqual(self.sheet._get_budget_diff(1), [])
+
+    def test_revisions_read_only(self):
+        user = new_test_user(self.env, login='revision_user',
+                             groups='base.group_user,purchase.group_purchase_user,stock.group_stock_user')
+        sheet = self.sheet.with_user(user)
+        revision = sheet._revise([
+            self._budget_vals(self.products[0], 20.0, 5.0),
+            self._budget_vals(self.products[1], 10.0, 16.0),
+        ])
+        self.assertEqual(revision.env.user, user)
+        self.assertEqual(revision.user_id, user)
+        # Revisions are only recorded by ``_revise``
+        with self.assertRaises(AccessError):
+            revision.note = "Rewritten"
+        with self.assertRaises(AccessError):
+            self.env['project.cost.sheet.revision'].with_user(user).create({
+                'cost_sheet_id': self.sheet.id, 'number': 2,
+            })
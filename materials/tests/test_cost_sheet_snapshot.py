@@ -0,0 +1,55 @@
+from datetime import date
+
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCostSheetSnapshot(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        products = cls.env['product.product'].create([
+            {'name': f'Snapshot Material {index}', 'type': 'consu'} for index in range(2)
+        ])
+        cls.project = cls.env['project.project'].create({'name': 'Snapshot Project'})
+        cls.sheet = cls.env['project.cost.sheet'].create({
+            'project_id': cls.project.id,
+            'state': 'in_progress',
+            'line_ids': [
+                Command.create({'product_id': product.id, 'quantity': 100.0, 'unit_cost': 10.0})
+                for product in products
+            ],
+        })
+        cls.line_1, cls.line_2 = cls.sheet.line_ids
+        cls.Snapshot = cls.env['project.cost.sheet.snapshot']
+
+    def _get_snapshots(self, line, period):
+        return self.Snapshot.search([('line_id', '=', line.id), ('period', '=', period)])
+
+    def test_snapshots(self):
+        day_1, day_2 = date(2026, 1, 1), date(2026, 1, 2)
+        self.assertEqual(self.Snapshot._take_snapshots(day_1), 2)
+
+        # A same-day re-run updates the snapshots of the day in place
+        self.line_1.actual_amount = 50.0
+        self.assertEqual(self.Snapshot._take_snapshots(day_1), 2)
+        self.assertEqual(self.Snapshot.search_count([('cost_sheet_id', '=', self.sheet.id)]), 2)
+        snapshot = self._get_snapshots(self.line_1, day_1)
+        self.assertEqual((snapshot.actual_amount, snapshot.actual_delta), (50.0, 50.0))
+        self.assertEqual((snapshot.budgeted_cost, snapshot.budgeted_delta), (1000.0, 1000.0))
+
+        # Unchanged lines are skipped on the next period
+        self.line_1.actual_amount = 80.0
+        self.assertEqual(self.Snapshot._take_snapshots(day_2), 1)
+        self.assertFalse(self._get_snapshots(self.line_2, day_2))
+        snapshot = self._get_snapshots(self.line_1, day_2)
+        self.assertEqual((snapshot.actual_amount, snapshot.actual_delta, snapshot.budgeted_delta), (80.0, 30.0, 0.0))
+
+        series = self.Snapshot._get_series(self.project.ids)
+        self.assertEqual([row['period'] for row in series], [day_1, day_2])
+        self.assertEqual([row['budgeted_cost'] for row in series], [2000.0, 2000.0])
+        self.assertEqual([row['actual_amount'] for row in series], [50.0, 80.0])
+        self.assertEqual(self.Snapshot._get_series(self.project.ids, date_from=day_2)[0]['actual_amount'], 80.0)
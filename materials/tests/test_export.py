@@ -0,0 +1,95 @@
+import json
+
+from odoo import Command
+from odoo.tests import HttpCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestBudgetExport(HttpCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        products = cls.env['product.product'].create([
+            {'name': f'Export Material {index}', 'type': 'consu'} for index in range(5)
+        ])
+        project = cls.env['project.project'].create({'name': 'Export Project'})
+        cls.sheet = cls.env['project.cost.sheet'].create({
+            'project_id': project.id,
+            'line_ids': [
+                Command.create({'product_id': product.id, 'quantity': 10.0, 'unit_cost': 5.0})
+                for product in products
+            ],
+        })
+        cls.env.flush_all()
+        # Records written in the test transaction share its timestamp, so
+        # pages are only told apart by the id part of the cursor
+        cls.since = cls.sheet.line_ids[0].write_date.isoformat()
+
+    def _export(self, dataset, headers=None, **params):
+        params = {'since': self.since, **params}
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.url_open(f'/materials/export/{dataset}?{query}', headers=headers)
+
+    def test_keyset_pages(self):
+        self.authenticate('admin', 'admin')
+        exported, cursor, pages = [], None, 0
+        while True:
+            response = self._export('cost_sheet_lines', limit=2, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+            exported += [json.loads(line) for line in response.text.splitlines()]
+            pages += 1
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual([values['id'] for values in exported], sorted(self.sheet.line_ids.ids))
+        self.assertEqual({values['budgeted_cost'] for values in exported}, {50.0})
+        self.assertEqual({values['cost_sheet_id'] for values in exported}, {self.sheet.id})
+
+    def test_conditional_requests(self):
+        self.authenticate('admin', 'admin')
+        response = self._export('cost_sheet_lines', limit=2)
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+        response = self._export('cost_sheet_lines', headers={'If-None-Match': etag}, limit=2)
+        self.assertEqual(response.status_code, 304)
+        response = self._export('cost_sheet_lines', headers={'If-Modified-Since': last_modified}, limit=2)
+        self.assertEqual(response.status_code, 304)
+
+        # A record written again leaves the page, which changes its keys
+        first_line = self.sheet.line_ids.sorted('id')[0]
+        self.env.cr.execute("""
+            UPDATE project_cost_sheet_line SET write_date = write_date + interval '1 minute' WHERE id = %s
+        """, [first_line.id])
+        response = self._export('cost_sheet_lines', headers={'If-None-Match': etag}, limit=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertNotIn(first_line.id, [json.loads(line)['id'] for line in response.text.splitlines()])
+
+    def test_reserved_lines_exported_again(self):
+        self.authenticate('admin', 'admin')
+        lines = self.sheet.line_ids.sorted('id')
+        # Lines last synced before ``since``
+        self.env.cr.execute("""
+            UPDATE project_cost_sheet_line SET write_date = write_date - interval '1 hour' WHERE id IN %s
+        """, [tuple(lines.ids)])
+        lines.invalidate_recordset(['write_date'])
+        response = self._export('cost_sheet_lines')
+        self.assertFalse(response.text)
+        etag = response.headers['ETag']
+
+        # Reserving goes through a raw UPDATE, which must stamp the line
+        self.env['project.budget.reservation']._post([{
+            'cost_sheet_line_id': lines[0].id, 'move_type': 'reserve', 'quantity': 2.0, 'amount': 10.0,
+        }])
+        response = self._export('cost_sheet_lines', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        exported = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([(values['id'], values['reserved_quantity']) for values in exported], [(lines[0].id, 2.0)])
+
+    def test_unknown_dataset(self):
+        self.authenticate('admin', 'admin')
+        self.assertEqual(self._export('invoices').status_code, 404)
@@ -0,0 +1,237 @@
+import math
+
+from odoo import Command
+from odoo.tests import tagged
+
+from .common import MaterialBudgetPerformanceCommon
+from ..models.cost_sheet import PROPAGATION_BATCH_SIZE, REFRESH_BATCH_SIZE
+from ..models.cost_sheet_refresh import REFRESH_CHUNK_SIZE
+
+
+@tagged('post_install', '-at_install', 'materials_perf')
+class TestBudgetPerformance(MaterialBudgetPerformanceCommon):
+    """Query-count and wall-time budgets of the budget engine hot paths.
+
+    Every path is measured at each size of ``sizes``; query ceilings only
+    grow with the number of batches, never with the number of lines.
+    """
+
+    sizes = (100, 1000)
+
+    def _refresh_query_budget(self, n_lines):
+        # Enqueueing, plus claiming, refreshing, dequeuing and stamping each chunk
+        chunks = math.ceil(n_lines / min(REFRESH_CHUNK_SIZE, REFRESH_BATCH_SIZE))
+        return 20 + 40 * chunks
+
+    def _time_budget(self, n_lines, seconds_per_thousand=2.0):
+        return 2.0 + seconds_per_thousand * n_lines / 1000
+
+    def test_update_actuals(self):
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines)
+                data['cost_lines'].write({'actual_amount': 0.0})
+                with self.assertQueryBudget(self._refresh_query_budget(n_lines), self._time_budget(n_lines)):
+                    data['sheets'].action_update_actuals()
+                    self.env['project.cost.sheet.refresh.queue']._process_queue()
+                self.assertEqual(set(data['cost_lines'].mapped('actual_amount')), {50.0})
+
+    def test_update_committed(self):
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, analytic_lines_per_line=0)
+                data['cost_lines'].write({'committed_quantity': 0.0, 'committed_amount': 0.0})
+                with self.assertQueryBudget(self._refresh_query_budget(n_lines), self._time_budget(n_lines)):
+                    data['sheets'].action_update_committed()
+                    self.env['project.cost.sheet.refresh.queue']._process_queue()
+                self.assertEqual(set(data['cost_lines'].mapped('committed_quantity')), {10.0})
+                self.assertEqual(set(data['cost_lines'].mapped('committed_amount')), {90.0})
+
+    def test_update_committed_converted(self):
+        company_currency = self.env.company.currency_id
+        foreign_currency = self.env.ref('base.EUR' if company_currency != self.env.ref('base.EUR') else 'base.USD')
+        foreign_currency.active = True
+        self.env['res.currency.rate'].create({
+            'name': '2000-01-01',
+            'rate': 2.0 * company_currency.with_company(self.env.company).rate,
+            'currency_id': foreign_currency.id,
+            'company_id': self.env.company.id,
+        })
+        dozen = self.env.ref('uom.product_uom_dozen')
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, analytic_lines_per_line=0)
+                orders = data['orders'].with_context(skip_budget_sync=True)
+                orders.write({'currency_id': foreign_currency.id})
+                orders.order_line.write({'product_uom': dozen.id})
+                data['cost_lines'].write({'committed_quantity': 0.0, 'committed_amount': 0.0})
+                # Rates and factors are fetched once per refresh, not per purchase line
+                with self.assertQueryBudget(self._refresh_query_budget(n_lines), self._time_budget(n_lines)):
+                    data['sheets'].action_update_committed()
+                    self.env['project.cost.sheet.refresh.queue']._process_queue()
+
+    def test_closed_sheets_frozen(self):
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, n_projects=4, analytic_lines_per_line=0)
+                closed_sheets, live_sheet = data['sheets'][:3], data['sheets'][3]
+                closed_sheets.action_done()
+                data['cost_lines'].write({'committed_quantity': 0.0, 'committed_amount': 0.0})
+                # Only the lines of the sheet in progress are refreshed
+                live_lines = len(live_sheet.line_ids)
+                with self.assertQueryBudget(self._refresh_query_budget(live_lines), self._time_budget(live_lines)):
+                    data['sheets'].action_update_committed()
+                    self.env['project.cost.sheet.refresh.queue']._process_queue()
+
+    def test_compute_total_costs(self):
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, n_projects=4, analytic_lines_per_line=0)
+                with self.assertQueryBudget(5, self._time_budget(n_lines, 0.2)):
+                    data['sheets']._compute_total_costs()
+                self.assertEqual(sum(data['sheets'].mapped('total_budgeted_cost')), n_lines * 1000.0)
+
+    def test_project_budget_kpis(self):
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, n_projects=4, analytic_lines_per_line=0)
+                projects = data['projects']
+                with self.assertQueryBudget(5, self._time_budget(n_lines, 0.1)):
+                    projects._compute_budget_kpis()
+
+    def test_stock_request_moves(self):
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, analytic_lines_per_line=0)
+                requests = data['requests']
+                requests.action_submit()
+                requests.action_in_progress()
+                self.env.cr.precommit.run()
+                request_lines = requests.line_ids
+                moves = requests.picking_ids.move_ids
+                for move in moves:
+                    move.quantity = move.product_uom_qty
+                moves.picked = True
+                requests.picking_ids._action_done()
+
+                # The aggregation costs the same whatever the number of lines
+                request_lines.write({'qty_done': 0.0})
+                requests.write({'state': 'in_progress'})
+                with self.assertQueryBudget(30, self._time_budget(n_lines, 0.5)):
+                    request_lines._update_move_quantities()
+                    self.env.flush_all()
+
+    def test_cost_sheet_revisions(self):
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, analytic_lines_per_line=0)
+                sheet = data['sheets']
+                lines = sheet.line_ids.sorted('id')
+                new_product = self.env['product.product'].create({'name': 'Revision Material', 'type': 'consu'})
+                lines_vals = [
+                    {'product_id': line.product_id.id, 'cost_code': line.cost_code,
+                     'quantity': 200.0 if index < 10 else line.quantity, 'unit_cost': line.unit_cost}
+                    for index, line in enumerate(lines[:-5])
+                ] + [{'product_id': new_product.id, 'cost_code': False, 'quantity': 3.0, 'unit_cost': 7.0}]
+                # Only the changed lines are written, whatever the size of the sheet
+                with self.assertQueryBudget(150, self._time_budget(n_lines, 1.0)):
+                    sheet._revise(lines_vals)
+                    self.env.flush_all()
+                # The budget as of any revision is resolved in one grouped query
+                with self.assertQueryBudget(3, self._time_budget(n_lines, 0.2)):
+                    sheet._get_effective_budget(0)
+
+    def test_onchange_product_project(self):
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, analytic_lines_per_line=0)
+                order = data['orders'][0]
+                products = data['products'][:50]
+                po_lines = [
+                    self.env['purchase.order.line'].new({'order_id': order.id, 'product_id': product.id})
+                    for product in products
+                ]
+                request_lines = [
+                    self.env['stock.request.line'].new({'request_id': data['requests'][0].id, 'product_id': product.id})
+                    for product in products
+                ]
+                self.env.registry.clear_cache()
+                # Cold cache: at most one lookup per (project, product) pair
+                with self.assertQueryBudget(10 + len(products), self._time_budget(n_lines, 0.1)):
+                    for line in po_lines:
+                        line._onchange_product_project()
+                # Warm cache: the stock request lines reuse the cached lookups
+                with self.assertQueryBudget(10, self._time_budget(n_lines, 0.1)):
+                    for line in request_lines:
+                        line._onchange_product_project()
+                cost_lines_by_product = {line.product_id: line for line in data['cost_lines']}
+                for line in po_lines + request_lines:
+                    self.assertEqual(line.cost_sheet_line_id, cost_lines_by_product[line.product_id])
+
+    def test_onchange_project_id(self):
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, analytic_lines_per_line=0)
+                products = data['products'][:300]
+                order = self.env['purchase.order'].new({
+                    'partner_id': self.partner.id,
+                    'project_id': data['projects'][0].id,
+                    'order_line': [Command.create({'product_id': product.id}) for product in products],
+                })
+                with self.assertQueryBudget(10, self._time_budget(n_lines, 0.1)):
+                    order._onchange_project_id()
+                self.assertEqual(order.order_line.cost_sheet_line_id.product_id, products)
+
+    def test_purchase_order_confirmation(self):
+        per_line_queries = {}
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, analytic_lines_per_line=0)
+                order = self.env['purchase.order'].create({
+                    'partner_id': self.partner.id,
+                    'project_id': data['projects'][0].id,
+                    'order_line': [
+                        Command.create({
+                            'product_id': cost_line.product_id.id,
+                            'product_qty': 1.0,
+                            'price_unit': 9.0,
+                            'cost_sheet_line_id': cost_line.id,
+                            'analytic_distribution': {
+                                f"{data['projects'][0].account_id.id},{self._get_cost_code_account(cost_line).id}": 100,
+                            },
+                        })
+                        for cost_line in data['cost_lines']
+                    ],
+                })
+                # Stock moves and pickings are created per line by the purchase flow
+                with self.assertQueryBudget(100 + 25 * n_lines, self._time_budget(n_lines, 20.0)) as measures:
+                    order.button_confirm()
+                per_line_queries[n_lines] = measures['queries'] / n_lines
+                self.assertEqual(set(data['cost_lines'].mapped('committed_quantity')), {11.0})
+                self.assertEqual(set(data['cost_lines'].mapped('reserved_quantity')), {11.0})
+        # The budget hooks must not make confirmation superlinear
+        smallest, largest = min(self.sizes), max(self.sizes)
+        self.assertLessEqual(per_line_queries[largest], per_line_queries[smallest] * 1.2)
+
+    def test_budget_revision(self):
+        for n_lines in self.sizes:
+            with self.subTest(n_lines=n_lines):
+                data = self._generate_dataset(n_lines, analytic_lines_per_line=0)
+                batches = math.ceil(len(data['orders']) / PROPAGATION_BATCH_SIZE) \
+                    + math.ceil(len(data['requests']) / PROPAGATION_BATCH_SIZE)
+                # One lookup per line model and one status recomputation per
+                # batch of parents, not per parent nor per line
+                with self.assertQueryBudget(60 + 20 * batches, self._time_budget(n_lines)):
+                    data['cost_lines'].write({'quantity': 1.0})
+                    self.env.flush_all()
+                self.assertEqual(set(data['orders'].order_line.mapped('budget_status')), {'overrun'})
+                self.assertTrue(all(data['orders'].mapped('budget_warning')))
+                self.assertEqual(set(data['requests'].line_ids.mapped('budget_status')), {'overrun'})
+                self.assertTrue(all(data['requests'].mapped('budget_warning')))
+
+
+@tagged('-standard', 'materials_perf_large')
+class TestBudgetPerformanceLarge(TestBudgetPerformance):
+    """Same budgets on 10,000 lines; run with ``--test-tags materials_perf_large``."""
+
+    sizes = (100, 10000)
@@ -0,0 +1,57 @@
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestProjectBudget(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        product = cls.env['product.product'].create({'name': 'KPI Material', 'type': 'consu'})
+        cls.project = cls.env['project.project'].create({'name': 'KPI Project'})
+        cls.live_sheet, cls.draft_sheet = cls.env['project.cost.sheet'].create([
+            {
+                'project_id': cls.project.id,
+                'state': state,
+                'line_ids': [Command.create({'product_id': product.id, 'quantity': quantity, 'unit_cost': 10.0})],
+            }
+            for state, quantity in (('in_progress', 10.0), ('draft', 5.0))
+        ])
+
+    def _get_kpis(self):
+        return (
+            self.project.budget_budgeted_cost,
+            self.project.budget_committed_amount,
+            self.project.budget_actual_amount,
+            self.project.budget_remaining,
+        )
+
+    def _search_over_budget(self):
+        return self.env['project.project'].search([('id', '=', self.project.id), ('is_over_budget', '=', True)])
+
+    def test_draft_sheets_excluded(self):
+        self.live_sheet.line_ids.write({'committed_amount': 60.0, 'actual_amount': 30.0})
+        self.assertEqual(self._get_kpis(), (100.0, 60.0, 30.0, 10.0))
+        self.assertAlmostEqual(self.project.budget_consumed_percent, 90.0)
+
+        # Figures of draft sheets are not part of the project budget yet
+        self.draft_sheet.line_ids.write({'committed_amount': 40.0})
+        self.assertEqual(self._get_kpis(), (100.0, 60.0, 30.0, 10.0))
+
+        self.draft_sheet.action_in_progress()
+        self.assertEqual(self._get_kpis(), (150.0, 100.0, 30.0, 20.0))
+        self.assertAlmostEqual(self.project.budget_consumed_percent, 130.0 / 1.5)
+        self.assertFalse(self._search_over_budget())
+
+        self.live_sheet.line_ids.actual_amount = 80.0
+        self.assertEqual(self._get_kpis(), (150.0, 100.0, 80.0, -30.0))
+        self.assertEqual(self._search_over_budget(), self.project)
+
+        # Closed sheets still count, sheets reset to draft no longer do
+        self.draft_sheet.action_done()
+        self.assertEqual(self._get_kpis(), (150.0, 100.0, 80.0, -30.0))
+        self.live_sheet.action_draft()
+        self.assertEqual(self._get_kpis(), (50.0, 40.0, 0.0, 10.0))
+        self.assertFalse(self._search_over_budget())
@@ -0,0 +1,77 @@
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestStockRequest(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, mail_notrack=True))
+        cls.product = cls.env['product.product'].create({'name': 'Requested Material', 'type': 'consu'})
+        cls.project = cls.env['project.project'].create({'name': 'Request Project'})
+        cls.sheet = cls.env['project.cost.sheet'].create({
+            'project_id': cls.project.id,
+            'state': 'in_progress',
+            'line_ids': [Command.create({'product_id': cls.product.id, 'quantity': 10.0, 'unit_cost': 5.0})],
+        })
+        cls.cost_line = cls.sheet.line_ids
+
+    def _create_request(self, quantity):
+        return self.env['stock.request'].create({
+            'project_id': self.project.id,
+            'line_ids': [Command.create({
+                'product_id': self.product.id,
+                'quantity': quantity,
+                'cost_sheet_line_id': self.cost_line.id,
+            })],
+        })
+
+    def test_cumulative_budget_status(self):
+        request_1 = self._create_request(6.0)
+        self.assertEqual(request_1.line_ids.budget_status, 'ok')
+        # Both requests together consume more than the budgeted quantity
+        request_2 = self._create_request(6.0)
+        self.assertEqual((request_1 | request_2).line_ids.mapped('budget_status'), ['overrun', 'overrun'])
+        self.assertTrue(request_1.budget_warning)
+
+        request_2.action_cancel()
+        self.assertEqual((request_1 | request_2).line_ids.mapped('budget_status'), ['ok', 'ok'])
+        self.assertFalse(request_1.budget_warning)
+
+    def test_unsaved_line_status(self):
+        request = self._create_request(6.0)
+        saved_line = request.line_ids
+        values = {
+            'request_id': request.id,
+            'product_id': self.product.id,
+            'cost_sheet_line_id': self.cost_line.id,
+        }
+        Line = self.env['stock.request.line']
+        # A new line adds its quantity to the saved ones
+        self.assertEqual(Line.new(dict(values, quantity=4.0)).budget_status, 'ok')
+        self.assertEqual(Line.new(dict(values, quantity=5.0)).budget_status, 'overrun')
+        # An edited line replaces its saved quantity instead of adding to it
+        self.assertEqual(Line.new(dict(values, quantity=9.0), origin=saved_line).budget_status, 'ok')
+        self.assertEqual(Line.new(dict(values, quantity=11.0), origin=saved_line).budget_status, 'overrun')
+
+    def test_partial_delivery(self):
+        request = self._create_request(5.0)
+        request.action_submit()
+        request.action_in_progress()
+        picking = request.picking_ids
+        picking.move_ids.write({'quantity': 2.0, 'picked': True})
+        picking._action_done()
+        # The backorder and its move stay linked to the request
+        backorder = request.picking_ids - picking
+        self.assertEqual(backorder.backorder_id, picking)
+        line = request.line_ids
+        self.assertEqual(backorder.move_ids.stock_request_line_id, line)
+        self.assertEqual((line.qty_done, line.qty_in_progress), (2.0, 3.0))
+        self.assertEqual(request.state, 'in_progress')
+
+        backorder.move_ids.write({'quantity': 3.0, 'picked': True})
+        backorder._action_done()
+        self.assertEqual((line.qty_done, line.qty_in_progress), (5.0, 0.0))
+        self.assertEqual(request.state, 'done')
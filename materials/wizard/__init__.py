@@ -0,0 +1,2 @@
+from . import cost_sheet_link_wizard
+from . import cost_sheet_import
@@ -0,0 +1,210 @@
+import base64
+import csv
+import io
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Number of rows turned into cost sheet lines per create() call
+IMPORT_BATCH_SIZE = 2000
+# Maximum number of row errors kept in the import log
+IMPORT_MAX_ERRORS = 1000
+
+# Accepted header names for each imported column
+IMPORT_COLUMNS = {
+    'default_code': ('default_code', 'product code', 'internal reference', 'product'),
+    'cost_code': ('cost_code', 'cost code'),
+    'cost_type': ('cost_type', 'cost type'),
+    'quantity': ('quantity', 'qty'),
+    'unit_cost': ('unit_cost', 'unit cost', 'price'),
+}
+IMPORT_REQUIRED_COLUMNS = ('default_code', 'quantity', 'unit_cost')
+
+
+class CostSheetImport(models.TransientModel):
+    _name = 'project.cost.sheet.import'
+    _description = 'Import Estimation into Cost Sheet'
+
+    data_file = fields.Binary('File', required=True, help="CSV or XLSX file with one budget line per row")
+    filename = fields.Char('File Name')
+    project_id = fields.Many2one('project.project', 'Project', required=True)
+    date = fields.Date('Date', default=fields.Date.context_today, required=True)
+    estimation_id = fields.Char('Estimation Reference')
+    revised_sheet_id = fields.Many2one('project.cost.sheet', 'Revise Cost Sheet',
+                                       domain="[('project_id', '=', project_id), ('state', '!=', 'done')]",
+                                       help="Import the estimation as a new revision of this cost sheet "
+                                            "instead of creating a new cost sheet")
+    revision_id = fields.Many2one('project.cost.sheet.revision', 'Revision', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('done', 'Done'),
+    ], default='draft')
+    cost_sheet_id = fields.Many2one('project.cost.sheet', 'Cost Sheet', readonly=True)
+    imported_count = fields.Integer('Imported Lines', readonly=True)
+    error_count = fields.Integer('Rejected Rows', readonly=True)
+    error_log = fields.Text('Errors', readonly=True)
+
+    def _iter_rows(self):
+        """Yield the rows of the uploaded file one at a time."""
+        self.ensure_one()
+        content = io.BytesIO(base64.b64decode(self.data_file))
+        if (self.filename or '').lower().endswith('.xlsx'):
+            if openpyxl is None:
+                raise UserError(_("Importing XLSX files requires the openpyxl Python library."))
+            workbook = openpyxl.load_workbook(content, read_only=True, data_only=True)
+            try:
+                yield from workbook.active.iter_rows(values_only=True)
+            finally:
+                workbook.close()
+        else:
+            yield from csv.reader(io.TextIOWrapper(content, encoding='utf-8-sig', newline=''))
+
+    @api.model
+    def _map_columns(self, header):
+        """Return the index of each known column in the header row."""
+        names = [self._cell_to_str(cell).lower() for cell in header or ()]
+        columns = {}
+        for column, aliases in IMPORT_COLUMNS.items():
+            for index, name in enumerate(names):
+                if name in aliases:
+                    columns[column] = index
+                    break
+        missing = [column for column in IMPORT_REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise UserError(_("Missing columns in the header row: %s", ', '.join(missing)))
+        return columns
+
+    @api.model
+    def _cell_to_str(self, value):
+        if value is None:
+            return ''
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value).strip()
+
+    @api.model
+    def _lookup_products(self, codes):
+        """Map default codes to product ids, ``False`` for ambiguous codes."""
+        products_by_code = {}
+        for product in self.env['product.product'].search_read(
+                [('default_code', 'in', list(codes))], ['default_code'], order='id'):
+            code = product['default_code']
+            products_by_code[code] = False if code in products_by_code else product['id']
+        return products_by_code
+
+    def _prepare_line_vals(self, row, columns, products_by_code, cost_types):
+        """Return the values of the cost sheet line of a row.
+
+        :raise ValueError: with a user-facing message when the row is invalid
+        """
+        def cell(column):
+            index = columns.get(column)
+            return self._cell_to_str(row[index]) if index is not None and index < len(row) else ''
+
+        code = cell('default_code')
+        if not code:
+            raise ValueError(_("Missing product code"))
+        product_id = products_by_code.get(code)
+        if product_id is None:
+            raise ValueError(_("Unknown product code %s", code))
+        if product_id is False:
+            raise ValueError(_("Several products use the code %s", code))
+        try:
+            quantity = float(cell('quantity'))
+            unit_cost = float(cell('unit_cost') or 0.0)
+        except ValueError:
+            raise ValueError(_("Quantity and unit cost must be numbers"))
+        if quantity <= 0:
+            raise ValueError(_("Quantity must be positive"))
+        cost_type = cell('cost_type').lower() or 'material'
+        if cost_type not in cost_types:
+            raise ValueError(_("Unknown cost type %s", cost_type))
+        return {
+            'cost_sheet_id': self.cost_sheet_id.id,
+            'product_id': product_id,
+            'cost_code': cell('cost_code') or False,
+            'cost_type': cost_type,
+            'quantity': quantity,
+            'unit_cost': unit_cost,
+        }
+
+    def action_import(self):
+        """Create a cost sheet and stream the file rows into its lines.
+
+        Rows are read lazily and turned into lines batch by batch. Product
+        codes unseen so far are resolved with one query per batch. Stored
+        computed fields, including the sheet totals, are only computed once
+        at the final flush. Invalid rows are logged and skipped.
+
+        When a cost sheet to revise is given, the rows are instead applied as
+        a new revision of it, which only writes the lines that change.
+        """
+        self.ensure_one()
+        rows = self._iter_rows()
+        columns = self._map_columns(next(rows, None))
+        if self.revised_sheet_id:
+            self.cost_sheet_id = self.revised_sheet_id
+        else:
+            self.cost_sheet_id = self.env['project.cost.sheet'].create({
+                'project_id': self.project_id.id,
+                'date': self.date,
+                'estimation_id': self.estimation_id,
+            })
+        revised_vals = []
+        CostSheetLine = self.env['project.cost.sheet.line']
+        cost_types = dict(CostSheetLine._fields['cost_type']._description_selection(self.env))
+        products_by_code = {}
+        errors = []
+        imported = 0
+        for batch in split_every(IMPORT_BATCH_SIZE, enumerate(rows, start=2)):
+            batch = [(row_number, row) for row_number, row in batch if any(self._cell_to_str(cell) for cell in row)]
+            index = columns['default_code']
+            codes = {
+                self._cell_to_str(row[index]) for __, row in batch if index < len(row)
+            } - set(products_by_code) - {''}
+            if codes:
+                products_by_code.update(dict.fromkeys(codes))
+                products_by_code.update(self._lookup_products(codes))
+            vals_list = []
+            for row_number, row in batch:
+                try:
+                    vals_list.append(self._prepare_line_vals(row, columns, products_by_code, cost_types))
+                except ValueError as error:
+                    errors.append(_("Row %(row)s: %(error)s", row=row_number, error=error.args[0]))
+            if self.revised_sheet_id:
+                revised_vals += vals_list
+            else:
+                CostSheetLine.create(vals_list)
+            imported += len(vals_list)
+        if self.revised_sheet_id:
+            self.revision_id = self.revised_sheet_id._revise(
+                revised_vals, note=_("Estimation import"), estimation_id=self.estimation_id)
+        self.env.flush_all()
+        self.write({
+            'state': 'done',
+            'imported_count': imported,
+            'error_count': len(errors),
+            'error_log': '\n'.join(errors[:IMPORT_MAX_ERRORS]),
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def action_open_cost_sheet(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'project.cost.sheet',
+            'res_id': self.cost_sheet_id.id,
+            'view_mode': 'form',
+        }
@@ -0,0 +1,76 @@
+from odoo import api, fields, models, _
+
+
+class CostSheetLinkWizard(models.TransientModel):
+    _name = 'project.cost.sheet.link.wizard'
+    _description = 'Link Lines to Cost Sheet Lines'
+
+    target = fields.Selection([
+        ('purchase', 'Purchase Order Lines'),
+        ('request', 'Material Request Lines'),
+        ('both', 'Both'),
+    ], string='Lines to Link', default='both', required=True)
+    project_ids = fields.Many2many('project.project', string='Projects',
+                                   help="Leave empty to process every project")
+    only_unlinked = fields.Boolean('Only Unlinked Lines', default=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('done', 'Done'),
+    ], default='draft')
+    linked_count = fields.Integer('Linked', readonly=True)
+    ambiguous_count = fields.Integer('Ambiguous', readonly=True,
+                                     help="Lines matching several cost sheet lines, left unlinked")
+    unmatched_count = fields.Integer('Unmatched', readonly=True)
+
+    def _get_source_domain(self):
+        self.ensure_one()
+        domain = [('project_id', '!=', False)]
+        if self.project_ids:
+            domain = [('project_id', 'in', self.project_ids.ids)]
+        if self.only_unlinked:
+            domain.append(('cost_sheet_line_id', '=', False))
+        return domain
+
+    def action_link(self):
+        self.ensure_one()
+        domain = self._get_source_domain()
+        summary = {'linked': 0, 'ambiguous': 0, 'unmatched': 0}
+        models_to_link = {
+            'purchase': ['purchase.order.line'],
+            'request': ['stock.request.line'],
+            'both': ['purchase.order.line', 'stock.request.line'],
+        }[self.target]
+        for model_name in models_to_link:
+            records = self.env[model_name].search(domain, order='id')
+            for key, count in self.env['project.cost.sheet.line']._link_source_lines(records).items():
+                summary[key] += count
+        self.write({
+            'state': 'done',
+            'linked_count': summary['linked'],
+            'ambiguous_count': summary['ambiguous'],
+            'unmatched_count': summary['unmatched'],
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    @api.model
+    def _notify_link_summary(self, summary):
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': _(
+                    "Linked: %(linked)s\n"
+                    "Ambiguous: %(ambiguous)s\n"
+                    "Unmatched: %(unmatched)s",
+                    **summary,
+                ),
+                'type': 'success' if not summary['unmatched'] and not summary['ambiguous'] else 'warning',
+                'sticky': True,
+            }
+        }